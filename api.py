@@ -1,10 +1,23 @@
-from fastapi import FastAPI, HTTPException, Body
+import os
+import json
+import logging
+import time
+import asyncio
+from fastapi import FastAPI, HTTPException, Body, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, List, Optional, Any
+import metrics
 import utils
+import pipeline
+from sessions import getSessionStore
+from llm_scheduler import DeadlineExceeded, Overloaded, getScheduler
+import resources
 
 app = FastAPI(title="Skincare Recommendation API")
+logger = logging.getLogger(__name__)
 
 # Enable CORS
 app.add_middleware(
@@ -15,6 +28,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """
+    Records request latency per route and, with METRICS_REQUEST_LOG set, logs
+    the stage timings of each request. Streaming responses are timed until
+    the first byte.
+    """
+    if not request.url.path.startswith("/api/"):
+        return await call_next(request)
+    started = time.perf_counter()
+    with metrics.traceRequest(method=request.method, path=request.url.path) as entry:
+        response = await call_next(request)
+        entry["status"] = response.status_code
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, path, str(response.status_code))
+    return response
+
 class QueryRequest(BaseModel):
     query: str
 
@@ -40,8 +71,70 @@ class RAGRequest(BaseModel):
 
 class ProductsRequest(BaseModel):
     query: str
-    # Note: In a real application, you'd want to handle the catalog_collection properly
-    # This is a simplified version
+    n_results: int = 5
+    # Set pool_size to re-rank a wider candidate pool by similarity and margin
+    pool_size: Optional[int] = None
+    margin_weight: float = 0.3
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    category: Optional[List[str]] = None
+
+# Shared filters apply to every query so the whole batch is one Chroma call
+class ProductsBatchRequest(BaseModel):
+    queries: List[str]
+    n_results: int = 5
+    pool_size: Optional[int] = None
+    margin_weight: float = 0.3
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    category: Optional[List[str]] = None
+
+class IntentBatchRequest(BaseModel):
+    queries: List[str]
+
+class SessionFinalRequest(BaseModel):
+    answers: str
+    n_results: int = 5
+    # Blend the first turn's candidates into the final ranking
+    reuse_candidates: bool = True
+
+MAX_BATCH_SIZE = int(os.getenv("API_MAX_BATCH_SIZE", "100"))
+SESSION_CANDIDATES = int(os.getenv("SESSION_CANDIDATES", "30"))
+INTENT_BATCH_CONCURRENCY = int(os.getenv("INTENT_BATCH_CONCURRENCY", "8"))
+
+def check_batch(queries):
+    if not queries:
+        raise HTTPException(status_code=400, detail="Invalid input: 'queries' cannot be empty")
+    if len(queries) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Invalid input: at most {MAX_BATCH_SIZE} queries per batch")
+
+def upstream_error(e):
+    """
+    Maps a failed call to an HTTP error: 503 with Retry-After when the LLM
+    provider keeps rate limiting, 504 when the call ran out of time, else 500.
+    """
+    if isinstance(e, Overloaded):
+        retry_after = max(1, round(e.retry_after or 1))
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(retry_after)})
+    if isinstance(e, DeadlineExceeded):
+        return HTTPException(status_code=504, detail=str(e))
+    return HTTPException(status_code=500, detail=str(e))
+
+@app.on_event("startup")
+async def warm_up():
+    """
+    Opens the catalog and the LLM client before the first request and, with
+    API_WARMUP_QUERY set, runs that product search once. A missing catalog is
+    reported by the endpoints that need it.
+    """
+    try:
+        await run_in_threadpool(resources.warmUp, os.getenv("API_WARMUP_QUERY") or None)
+    except Exception as e:
+        logger.warning("Warm-up skipped: %s", e)
+
+async def get_catalog():
+    """The catalog engine; opened on a worker thread so the first load never blocks the event loop."""
+    return await run_in_threadpool(resources.getCatalog)
 
 @app.post("/api/intent")
 async def get_intent(request: QueryRequest):
@@ -49,10 +142,145 @@ async def get_intent(request: QueryRequest):
     Classifies a user query as either 'Recommendation' or 'Non-Recommendation'.
     """
     try:
-        intent = utils.findIntent(request.query)
+        intent = await utils.adetectIntent(request.query)
         return {"intent": intent.strip()}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e)
+
+@app.post("/api/intent/batch")
+async def get_intent_batch(request: IntentBatchRequest):
+    """
+    Classifies many queries at once. LLM fallbacks run concurrently with a
+    bounded fan-out; results come back in request order, with an 'error'
+    entry instead of 'intent' for items that failed.
+    """
+    check_batch(request.queries)
+    semaphore = asyncio.Semaphore(INTENT_BATCH_CONCURRENCY)
+
+    async def classify(query):
+        if not query.strip():
+            raise ValueError("query cannot be empty")
+        async with semaphore:
+            return await utils.adetectIntent(query)
+
+    outcomes = await asyncio.gather(*(classify(q) for q in request.queries), return_exceptions=True)
+    results = []
+    for query, outcome in zip(request.queries, outcomes):
+        if isinstance(outcome, Exception):
+            results.append({"query": query, "error": str(outcome)})
+        else:
+            results.append({"query": query, "intent": outcome.strip()})
+    return {"results": results}
+
+@app.post("/api/recommendation/start")
+async def start_recommendation(request: QueryRequest):
+    """
+    Runs the first turn in one call: intent classification, product retrieval
+    and follow-up questions run concurrently, and the work a non-recommendation
+    intent does not need is cancelled.
+    """
+    try:
+        turn = await pipeline.afirstTurn(request.query, await get_catalog())
+        if turn["intent"] != "Recommendation":
+            return {"intent": turn["intent"]}
+        return {
+            "intent": turn["intent"],
+            "products": turn["products"],
+            "questions": turn["questions"].strip()
+        }
+    except Exception as e:
+        raise upstream_error(e)
+
+@app.post("/api/session/start")
+async def start_session(request: QueryRequest):
+    """
+    Runs the first turn like /api/recommendation/start and keeps its state
+    (query, questions, products and a wider candidate pool) under a new
+    conversation id for /api/session/{conversation_id}/final.
+    """
+    try:
+        turn = await pipeline.afirstTurn(request.query, await get_catalog(), pool_size=SESSION_CANDIDATES)
+    except Exception as e:
+        raise upstream_error(e)
+    store = getSessionStore()
+    if turn["intent"] != "Recommendation":
+        conversation_id = await run_in_threadpool(store.create, query=request.query, intent=turn["intent"])
+        return {"conversation_id": conversation_id, "intent": turn["intent"]}
+    questions = turn["questions"].strip()
+    conversation_id = await run_in_threadpool(
+        store.create,
+        query=request.query,
+        intent=turn["intent"],
+        questions=questions,
+        products=turn["products"],
+        candidates=turn["candidates"],
+        catalog_version=await run_in_threadpool(resources.catalogVersion)
+    )
+    return {
+        "conversation_id": conversation_id,
+        "intent": turn["intent"],
+        "products": turn["products"],
+        "questions": questions
+    }
+
+async def get_session_or_404(conversation_id):
+    # With SESSION_PATH set every store call is SQLite I/O, so it runs off the event loop
+    state = await run_in_threadpool(getSessionStore().get, conversation_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation_id")
+    return state
+
+@app.post("/api/session/{conversation_id}/final")
+async def finish_session(conversation_id: str, request: SessionFinalRequest):
+    """
+    Builds the enriched query from the stored first turn and the answers,
+    and returns the final products. The final query's candidates are fused
+    with the first turn's unless reuse_candidates is false. Repeating the
+    same answers returns the stored result. Candidates and results stored
+    under an older catalog version are not reused.
+    """
+    state = await get_session_or_404(conversation_id)
+    if state.get("intent") != "Recommendation":
+        raise HTTPException(status_code=400, detail="Conversation is not a recommendation flow")
+    final_request = [request.answers, request.n_results, request.reuse_candidates]
+    version = await run_in_threadpool(resources.catalogVersion)
+    current = state.get("catalog_version") == version
+    if current and state.get("final_request") == final_request:
+        return {"conversation_id": conversation_id, "recommendation": state["final_query"],
+                "products": state["final_products"]}
+    try:
+        final_query = (await utils.arecommFinalQuery(state["query"], request.answers)).strip()
+        candidates = await run_in_threadpool(
+            lambda: utils.getCandidates(final_query, resources.getCatalog(), max(SESSION_CANDIDATES, request.n_results))
+        )
+    except Exception as e:
+        raise upstream_error(e)
+    if request.reuse_candidates and current and state.get("candidates"):
+        candidates = utils.mergeCandidates(candidates, state["candidates"])
+    products = utils.productsFromCandidates(candidates, request.n_results)
+    try:
+        # A first-turn pool from a replaced catalog version is dropped with the update
+        stale = {} if current else {"candidates": None}
+        await run_in_threadpool(getSessionStore().update, conversation_id, answers=request.answers,
+                                final_query=final_query, final_products=products, final_request=final_request,
+                                catalog_version=version, **stale)
+    except KeyError:
+        pass
+    return {"conversation_id": conversation_id, "recommendation": final_query, "products": products}
+
+@app.get("/api/session/{conversation_id}")
+async def get_session(conversation_id: str):
+    """
+    Returns the stored conversation state without the candidate pool.
+    """
+    state = await get_session_or_404(conversation_id)
+    state.pop("candidates", None)
+    return dict(state, conversation_id=conversation_id)
+
+@app.delete("/api/session/{conversation_id}")
+async def delete_session(conversation_id: str):
+    await run_in_threadpool(getSessionStore().delete, conversation_id)
+    return {"deleted": conversation_id}
 
 @app.post("/api/recommendation/questions")
 async def get_recommendation_questions(request: QueryRequest):
@@ -60,10 +288,10 @@ async def get_recommendation_questions(request: QueryRequest):
     Generates follow-up questions for recommendation queries.
     """
     try:
-        questions = utils.recommQuestion(request.query)
+        questions = await utils.arecommQuestion(request.query)
         return {"questions": questions.strip()}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e)
 
 @app.post("/api/recommendation/final")
 async def get_final_recommendation(request: RecommendationFinalRequest):
@@ -71,10 +299,78 @@ async def get_final_recommendation(request: RecommendationFinalRequest):
     Creates a structured query based on user's initial query and follow-up answers.
     """
     try:
-        result = utils.recommFinalQuery(request.query, request.answers)
+        result = await utils.arecommFinalQuery(request.query, request.answers)
         return {"recommendation": result.strip()}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e)
+
+def validate_rag_request(request: RAGRequest):
+    """
+    Raises a 400 HTTPException when the RAG request body is unusable.
+    """
+    if not request.results or 'documents' not in request.results:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid input: 'results' must contain 'documents' key with a list of context strings"
+        )
+        
+    if not request.user_question or not request.user_question.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid input: 'user_question' cannot be empty"
+        )
+        
+    # Validate documents format
+    if not isinstance(request.results['documents'], list) or not all(isinstance(doc, str) for doc in request.results['documents']):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid format: 'documents' must be a list of strings"
+        )
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def sse_stream(deltas):
+    """
+    Relays text deltas as server-sent events: one 'data' event per delta, then
+    a 'done' event with time to first token and total latency, or an 'error'
+    event if generation fails part-way.
+    """
+    started = time.perf_counter()
+    first_token_ms = None
+    try:
+        async for delta in deltas:
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - started) * 1000
+            yield sse_event({"delta": delta})
+    except Exception as e:
+        yield sse_event({"error": str(e), "type": type(e).__name__}, event="error")
+        return
+    total_ms = (time.perf_counter() - started) * 1000
+    yield sse_event({"ttft_ms": first_token_ms if first_token_ms is not None else total_ms, "total_ms": total_ms}, event="done")
+
+def event_stream(deltas):
+    return StreamingResponse(
+        sse_stream(deltas),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/recommendation/questions/stream")
+async def stream_recommendation_questions(request: QueryRequest):
+    """
+    Streams follow-up questions as server-sent events while they are generated.
+    """
+    return event_stream(utils.astreamRecommQuestion(request.query))
+
+@app.post("/api/rag/stream")
+async def stream_rag_response(request: RAGRequest):
+    """
+    Streams the RAG answer as server-sent events while it is generated.
+    """
+    validate_rag_request(request)
+    return event_stream(utils.astreamRAG(request.results, request.user_question))
 
 @app.post("/api/rag")
 async def get_rag_response(request: RAGRequest):
@@ -86,28 +382,10 @@ async def get_rag_response(request: RAGRequest):
     - user_question: The question to be answered based on the provided context
     """
     try:
-        # Input validation
-        if not request.results or 'documents' not in request.results:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid input: 'results' must contain 'documents' key with a list of context strings"
-            )
-            
-        if not request.user_question or not request.user_question.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid input: 'user_question' cannot be empty"
-            )
-            
-        # Validate documents format
-        if not isinstance(request.results['documents'], list) or not all(isinstance(doc, str) for doc in request.results['documents']):
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid format: 'documents' must be a list of strings"
-            )
+        validate_rag_request(request)
         
         # Call the RAG function
-        response = utils.RAG(request.results, request.user_question)
+        response = await utils.aRAG(request.results, request.user_question)
         
         if not response or not response.strip():
             return {
@@ -131,6 +409,9 @@ async def get_rag_response(request: RAGRequest):
     except HTTPException:
         # Re-raise HTTP exceptions as they are
         raise
+
+    except (Overloaded, DeadlineExceeded) as e:
+        raise upstream_error(e)
         
     except Exception as e:
         # Log the full error for debugging
@@ -152,17 +433,93 @@ async def get_rag_response(request: RAGRequest):
 @app.post("/api/products")
 async def get_products(request: ProductsRequest):
     """
-    Retrieves and sorts products based on a query.
-    Note: This is a simplified version. In a real application, you'd need to handle the catalog_collection properly.
+    Retrieves products matching a query, sorted by margin, or re-ranked over a
+    wider candidate pool when pool_size is given. Price and category filter
+    the candidates before ranking.
     """
     try:
-        # In a real application, you'd want to properly initialize and pass the catalog_collection
-        # For now, we'll return a not implemented response
-        raise HTTPException(status_code=501, detail="Product search functionality not fully implemented")
-        # products = utils.getProducts(request.query, catalog_collection)
-        # return {"products": products}
+        # Opening the catalog, Chroma and the embedding call are blocking, so keep them off the event loop
+        products = await run_in_threadpool(lambda: utils.getProducts(
+            request.query,
+            resources.getCatalog(),
+            n_results=request.n_results,
+            pool_size=request.pool_size,
+            margin_weight=request.margin_weight,
+            min_price=request.min_price,
+            max_price=request.max_price,
+            category=request.category
+        ))
+        return {"products": products}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e)
+
+@app.post("/api/products/batch")
+async def get_products_batch(request: ProductsBatchRequest):
+    """
+    Searches products for many queries with one embedding request and one
+    multi-query Chroma lookup. Results come back in request order; empty
+    queries get an 'error' entry instead of 'products'.
+    """
+    check_batch(request.queries)
+    valid = [i for i, q in enumerate(request.queries) if q.strip()]
+    try:
+        found = await run_in_threadpool(lambda: utils.searchProducts(
+            [request.queries[i] for i in valid],
+            resources.getCatalog(),
+            n_results=request.n_results,
+            pool_size=request.pool_size,
+            margin_weight=request.margin_weight,
+            min_price=request.min_price,
+            max_price=request.max_price,
+            category=request.category
+        ))
+    except Exception as e:
+        raise upstream_error(e)
+
+    products = dict(zip(valid, found))
+    results = []
+    for i, query in enumerate(request.queries):
+        if i in products:
+            results.append({"query": query, "products": products[i]})
+        else:
+            results.append({"query": query, "error": "query cannot be empty"})
+    return {"results": results}
+
+def cache_families():
+    """Intent fast-path and cache counters rendered as Prometheus families."""
+    families = [metrics.renderFamily(
+        "skincare_intent_decisions_total", "Intent queries answered locally or by the LLM", "counter",
+        [({"path": path}, count) for path, count in sorted(utils.INTENT_STATS.items())]
+    )]
+    response_cache = utils.getResponseCache()
+    if response_cache is not None:
+        stats = response_cache.stats.as_dict()
+        families.append(metrics.renderFamily(
+            "skincare_llm_cache_total", "LLM response cache lookups and evictions", "counter",
+            [({"result": k}, v) for k, v in stats.items() if k != "hit_rate"]
+        ))
+    embedding_stats = getattr(resources.getEmbeddingFunction(), "stats", {})
+    families.append(metrics.renderFamily(
+        "skincare_embedding_cache_total", "Query embedding cache activity", "counter",
+        [({"result": k}, v) for k, v in sorted(embedding_stats.items())]
+    ))
+    limiter = getScheduler().limiter
+    families.append(metrics.renderFamily(
+        "skincare_llm_concurrency_limit", "Current adaptive limit on in-flight LLM requests", "gauge",
+        [({}, int(limiter.limit))]
+    ))
+    families.append(metrics.renderFamily(
+        "skincare_llm_inflight", "LLM requests currently in flight", "gauge",
+        [({}, limiter.inflight)]
+    ))
+    return families
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Stage latency histograms, token usage and cache counters in Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(cache_families()), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,47 +1,43 @@
-import os
 import streamlit as st
-import chromadb
-import chromadb.utils.embedding_functions as embedding_functions
 from dotenv import load_dotenv
 
 # Your helper functions
-from utils import findIntent, getProducts, recommQuestion, recommFinalQuery, RAG
+from utils import streamRAG
+from pipeline import firstTurn, finalTurn
+import resources
 
 load_dotenv()
 
+# set_page_config must be the first Streamlit call of a run, before the
+# cached loaders below can show their spinner.
+st.set_page_config(
+    page_title="SkinCare Recommendations",
+    page_icon="🛍️",
+    layout="centered"
+)
+
 # ──────────────────────────────────────────────────────────────────────────────
 # 1.  Initialize ChromaDB collections
 # ──────────────────────────────────────────────────────────────────────────────
 
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-    model_name="text-embedding-3-large",
-    api_key=os.environ["OPENAI_API_KEY"]
-)
+# Streamlit re-runs this script on every interaction; cache_resource keeps one
+# catalog engine and docs collection per server process instead.
+@st.cache_resource
+def load_catalog():
+    return resources.getCatalog()
 
-# Catalog (products) collection
-catalog_client = chromadb.PersistentClient(path="catalog")
-catalog_collection = catalog_client.get_collection(
-    name="catalogs",
-    embedding_function=openai_ef
-)
+@st.cache_resource
+def load_docs():
+    return resources.getDocs()
 
-# Docs (for RAG) collection
-docs_client = chromadb.PersistentClient(path="docs")
-docs_collection = docs_client.get_collection(
-    name="docs",
-    embedding_function=openai_ef
-)
+catalog_collection = load_catalog()
+docs_collection = load_docs()
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # 2.  Streamlit: set up page and session_state
 # ──────────────────────────────────────────────────────────────────────────────
 
-st.set_page_config(
-    page_title="SkinCare Recommendations",
-    page_icon="🛍️",
-    layout="centered"
-)
 st.title("🛍️ SkinCare Recommendations")
 
 if "stage" not in st.session_state:
@@ -84,30 +80,27 @@ def on_submit():
     # ──────────────────────────────────────────────────────────────────────────
     if st.session_state.stage == "awaiting_initial":
         st.session_state.initial_query = text
-        intent = findIntent(text)
+
+        # Intent, product retrieval, follow-up generation and docs retrieval
+        # run concurrently; whatever the intent does not need is cancelled.
+        turn = firstTurn(text, catalog_collection, docs_collection, stream_questions=True)
+        intent = turn["intent"]
         st.session_state.intent = intent
 
         if intent == "Recommendation":
-            # Fetch initial products
-            initial = getProducts(text, catalog_collection)
-            st.session_state.initial_products = initial
+            st.session_state.initial_products = turn["products"]
 
-            # Generate the follow-up question
-            followup = recommQuestion(text)
-            st.session_state.followup_question = followup
+            # Already generating; streamed in while the page renders
+            st.session_state.followup_stream = turn["questions"]
 
             # Move to next stage
             st.session_state.stage = "ask_followup"
             st.session_state.user_input = ""  # clear the input box
 
         else:
-            # RAG‐based path
-            hits = docs_collection.query(
-                query_texts=[text],
-                n_results=5
-            )
-            answer = RAG(hits, text)
-            st.session_state.rag_answer = answer
+            # RAG‐based path: the answer itself is streamed in while the page renders
+            st.session_state.rag_hits = turn["hits"]
+            st.session_state.rag_question = text
             st.session_state.stage = "show_rag"
             st.session_state.user_input = ""  # clear the input box
 
@@ -118,10 +111,8 @@ def on_submit():
         followup_answer = text
         orig = st.session_state.initial_query
 
-        refined_q = recommFinalQuery(orig, followup_answer)
+        refined_q, final_prods = finalTurn(orig, followup_answer, catalog_collection)
         st.session_state.final_query = refined_q
-
-        final_prods = getProducts(refined_q, catalog_collection)
         st.session_state.final_products = final_prods
 
         st.session_state.stage = "show_final"
@@ -136,7 +127,12 @@ if st.session_state.stage in ("awaiting_initial", "ask_followup"):
     if st.session_state.stage == "awaiting_initial":
         label = "Enter your question or request:"
     else:  # "ask_followup"
-        label = st.session_state.followup_question
+        # Stream the follow-up question token by token on first render
+        if "followup_question" not in st.session_state:
+            st.session_state.followup_question = st.write_stream(st.session_state.followup_stream)
+        else:
+            st.markdown(st.session_state.followup_question)
+        label = "Your answer:"
 
     st.text_input(
         label=label,
@@ -201,7 +197,12 @@ if st.session_state.stage == "show_final":
 # 4C) If intent ≠ Recommendation → stage == "show_rag"
 if st.session_state.stage == "show_rag":
     st.subheader("📖 RAG-Based Answer")
-    st.write(st.session_state.rag_answer)
+    if "rag_answer" not in st.session_state:
+        st.session_state.rag_answer = st.write_stream(
+            streamRAG(st.session_state.rag_hits, st.session_state.rag_question)
+        )
+    else:
+        st.write(st.session_state.rag_answer)
 
     if st.button("🔄 New Query"):
         for k in list(st.session_state.keys()):
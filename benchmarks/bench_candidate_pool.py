@@ -0,0 +1,102 @@
+"""
+Latency of margin-aware re-ranking as the candidate pool grows.
+
+    python benchmarks/bench_candidate_pool.py --pools 5,10,20,50,100 --synthetic 5000
+
+Runs ``utils.getProducts`` against a Chroma collection with precomputed query
+vectors (no embedding calls). ``--synthetic N`` builds a throwaway collection
+of N noisy copies of the catalog so pools larger than the real catalog mean
+something.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import chromadb  # noqa: E402
+import utils  # noqa: E402
+
+
+class PrecomputedQueries:
+    """Embedding function that maps query strings to prepared vectors."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def __call__(self, input):
+        return [self.vectors[int(text)] for text in input]
+
+
+class QueryCollection:
+    """Passes text queries through as precomputed embeddings."""
+
+    def __init__(self, collection, embed):
+        self.collection = collection
+        self.embed = embed
+
+    def query(self, query_texts, **kwargs):
+        return self.collection.query(query_embeddings=self.embed(query_texts), **kwargs)
+
+
+def buildSynthetic(source, rows, path):
+    data = source.get(include=["embeddings", "metadatas", "documents"])
+    base = np.asarray(data["embeddings"], dtype=np.float32)
+    rng = np.random.default_rng(0)
+    collection = chromadb.PersistentClient(path=path).create_collection("bench", embedding_function=None)
+    for start in range(0, rows, 1000):
+        n = min(1000, rows - start)
+        pick = rng.integers(0, len(base), n)
+        vectors = base[pick] + rng.normal(0, 0.02, (n, base.shape[1])).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        metas = [dict(data["metadatas"][i], margin=float(rng.uniform(0.2, 0.6))) for i in pick]
+        collection.add(ids=[f"p{start + j}" for j in range(n)], embeddings=vectors, metadatas=metas)
+    return collection, base
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=os.path.join(ROOT, "catalog"))
+    parser.add_argument("--pools", default="5,10,20,50,100")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--synthetic", type=int, default=0)
+    parser.add_argument("--max-price", type=float, default=None)
+    args = parser.parse_args()
+
+    source = chromadb.PersistentClient(path=args.path).get_collection("catalogs")
+    tmp = None
+    if args.synthetic:
+        tmp = tempfile.mkdtemp()
+        collection, base = buildSynthetic(source, args.synthetic, tmp)
+    else:
+        collection = source
+        base = np.asarray(source.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+
+    rng = np.random.default_rng(1)
+    vectors = base[rng.integers(0, len(base), args.queries)] + rng.normal(0, 0.02, (args.queries, base.shape[1])).astype(np.float32)
+    target = QueryCollection(collection, PrecomputedQueries(vectors))
+
+    print(f"rows: {collection.count()}  queries: {args.queries}")
+    print(f"{'pool':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    try:
+        for pool in [int(p) for p in args.pools.split(",")]:
+            latencies = []
+            for i in range(args.queries):
+                start = time.perf_counter()
+                utils.getProducts(str(i), target, n_results=5, pool_size=pool, max_price=args.max_price)
+                latencies.append((time.perf_counter() - start) * 1000)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            print(f"{pool:>6} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f}")
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Hot catalog reload under load: sync duration, staleness window and errors.
+
+    python benchmarks/bench_catalog_sync.py --rounds 3 --concurrency 8
+
+Publishes a first catalog version from a CSV copy of the spreadsheet in a
+drop directory, starts ``uvicorn api:app`` on it and ``catalog_sync.py
+--watch`` on the drop directory, and keeps ``/api/products`` busy. Each
+round renames one product in the CSV and reports, from the moment the file
+was written: when the watcher first saw it, its sync time (from the
+version's ``sync.json``), when ``CURRENT`` was switched, and when the API
+first returned the new name. Latency is reported for requests away from a
+swap and for those within a second of one; no request should fail.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+from harness import ROOT, percentile, startApi, startMock
+
+sys.path.insert(0, ROOT)
+
+
+def publishFirst(drop, versions, env):
+    subprocess.run([sys.executable, "catalog_sync.py", "--once", "--watch", drop, "--root", versions, "--seed", ""],
+                   cwd=ROOT, env=dict(os.environ, **env), check=True, stdout=subprocess.DEVNULL)
+
+
+def waitForWatcher(log, watcher, timeout=60):
+    deadline = time.time() + timeout
+    while "Watching" not in open(log).read():
+        if watcher.poll() is not None or time.time() > deadline:
+            raise RuntimeError(f"catalog_sync.py --watch did not start:\n{open(log).read()}")
+        time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=0.5, help="watcher poll interval (s)")
+    parser.add_argument("--embed-latency", default="fixed:80")
+    parser.add_argument("--port", type=int, default=8012)
+    parser.add_argument("--mock-port", type=int, default=8773)
+    args = parser.parse_args()
+
+    os.environ.update({"OPENAI_BASE_URL": f"http://127.0.0.1:{args.mock_port}/v1", "OPENAI_API_KEY": "sk-mock"})
+    mock = startMock(args.mock_port, "--embed-latency", args.embed_latency)
+    workdir = tempfile.mkdtemp(prefix="skincare-sync-")
+    drop, versions = os.path.join(workdir, "drop"), os.path.join(workdir, "versions")
+    os.makedirs(drop)
+    env = {"CATALOG_VERSIONS_PATH": versions, "LLM_CACHE_PATH": "", "EMBEDDING_CACHE_PATH": ""}
+    api = watcher = None
+    try:
+        import catalogDB
+
+        df = catalogDB.loadCatalog(os.path.join(ROOT, catalogDB.DEFAULT_FILE))
+        source = os.path.join(drop, "catalog.csv")
+        df.to_csv(source, index=False)
+        publishFirst(drop, versions, env)
+        api = startApi(args.port, env, timeout=120)
+        log = os.path.join(workdir, "watcher.log")
+        with open(log, "w") as f:
+            watcher = subprocess.Popen(
+                [sys.executable, "catalog_sync.py", "--watch", drop, "--root", versions, "--seed", "",
+                 "--interval", str(args.interval)],
+                cwd=ROOT, env=dict(os.environ, **env), stdout=f, stderr=subprocess.STDOUT)
+        waitForWatcher(log, watcher)
+
+        url = f"http://127.0.0.1:{args.port}/api/products"
+        target = {"name": df.loc[0, "name"]}
+        samples, errors, stop = [], [], threading.Event()
+
+        def load():
+            with httpx.Client(timeout=30) as client:
+                while not stop.is_set():
+                    name, start = target["name"], time.perf_counter()
+                    try:
+                        response = client.post(url, json={"query": name})
+                        response.raise_for_status()
+                        names = [p["Name"] for p in response.json()["products"]]
+                        samples.append((time.time(), time.perf_counter() - start, name, name in names))
+                    except Exception as e:
+                        errors.append(repr(e))
+
+        threads = [threading.Thread(target=load, daemon=True) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        time.sleep(2.0)
+
+        print(f"{'round':>5} {'sync s':>7} {'detect s':>9} {'published s':>12} {'visible s':>10}")
+        swaps = []
+        for n in range(1, args.rounds + 1):
+            renamed = f"{df.loc[0, 'name'].split(' #')[0]} #{n}"
+            df.loc[0, "name"] = renamed
+            df.to_csv(source, index=False)
+            written = os.path.getmtime(source)
+            target["name"] = renamed
+            visible = None
+            deadline = time.time() + 60
+            while visible is None and time.time() < deadline:
+                time.sleep(0.05)
+                visible = next((t for t, _, name, found in samples[-args.concurrency * 4:] if found and name == renamed),
+                               None)
+            current = open(os.path.join(versions, "CURRENT")).read().strip()
+            with open(os.path.join(versions, current, "sync.json")) as f:
+                manifest = json.load(f)
+            swaps.append(visible or time.time())
+            print(f"{n:>5} {manifest['sync_seconds']:>7.2f} {manifest['detected_at'] - written:>9.2f} "
+                  f"{os.path.getmtime(os.path.join(versions, 'CURRENT')) - written:>12.2f} "
+                  f"{(visible - written) if visible else float('nan'):>10.2f}")
+            time.sleep(1.0)
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+        near = [latency for t, latency, _, _ in samples if any(abs(t - swap) < 1.0 for swap in swaps)]
+        away = [latency for t, latency, _, _ in samples if all(abs(t - swap) >= 1.0 for swap in swaps)]
+        print(f"\nrequests: {len(samples)}  errors: {len(errors)}" + (f"  e.g. {errors[0]}" if errors else ""))
+        for label, values in (("steady", away), ("near swap", near)):
+            print(f"{label:<10} p50 {percentile(values, 50) * 1000:7.1f} ms  p99 {percentile(values, 99) * 1000:7.1f} ms"
+                  f"  ({len(values)} requests)")
+        staleness = [line for line in httpx.get(f"http://127.0.0.1:{args.port}/metrics").text.splitlines()
+                     if line.startswith(("skincare_catalog_staleness_seconds_count", "skincare_catalog_swaps_total"))]
+        print("\n".join(staleness))
+    finally:
+        for proc in (watcher, api, mock):
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Recall@k, latency and memory of embedding profiles against the full-precision baseline.
+
+    python benchmarks/bench_embedding_profiles.py --path catalog
+    python benchmarks/bench_embedding_profiles.py --synthetic 50000 --dims 3072,1024,256
+
+A profile is an output dimension (EMBEDDING_DIMENSIONS) plus a storage type
+for the NumPy index (CATALOG_QUANTIZATION) and a rescoring factor
+(CATALOG_RESCORE). Shorter vectors are made from the stored
+text-embedding-3 vectors by keeping the first columns and re-normalizing,
+which is what the API returns for ``dimensions``, so no embedding calls are
+made. Ground truth is the exact top-k over full-size float32 vectors.
+
+Queries are blends of two catalog vectors plus noise. With ``--synthetic N``
+the catalog is tiled with noise up to N rows to see how latency and memory
+scale; recall there only means something at full size, since tiled copies
+differ by noise that shorter vectors cannot resolve.
+
+Rescoring here reads full-precision rows from memory; in the app they are
+read back from Chroma, which adds a few milliseconds per query.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import chromadb  # noqa: E402
+from vector_index import IndexSnapshot, normalizeRows, truncateRows  # noqa: E402
+
+
+def loadVectors(path, synthetic, rng):
+    data = chromadb.PersistentClient(path=path).get_collection("catalogs").get(include=["embeddings"])
+    matrix = normalizeRows(np.asarray(data["embeddings"], dtype=np.float32))
+    if synthetic > len(matrix):
+        reps = -(-synthetic // len(matrix))
+        tiled = np.tile(matrix, (reps, 1))[:synthetic]
+        matrix = normalizeRows(tiled + rng.normal(0, 0.01, tiled.shape).astype(np.float32))
+    return matrix
+
+
+def makeQueries(matrix, n, rng):
+    a, b = rng.integers(0, len(matrix), n), rng.integers(0, len(matrix), n)
+    weights = rng.uniform(0.5, 1.0, (n, 1)).astype(np.float32)
+    noise = rng.normal(0, 0.01, (n, matrix.shape[1])).astype(np.float32)
+    return normalizeRows(weights * matrix[a] + (1 - weights) * matrix[b] + noise)
+
+
+def run(snapshot, queries, k):
+    found, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        idx, _ = snapshot.topk(q, k)
+        latencies.append(time.perf_counter() - start)
+        found.append(set(idx.tolist()))
+    return found, np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=os.path.join(ROOT, "catalog"))
+    parser.add_argument("--synthetic", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", default="3072,1536,1024,512,256")
+    parser.add_argument("--quantization", default="float32,float16,int8")
+    parser.add_argument("--rescore", default="0,4", help="rescoring factors tried for quantized profiles")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    full = loadVectors(args.path, args.synthetic, rng)
+    queries = makeQueries(full, args.queries, rng)
+    ids = [str(i) for i in range(len(full))]
+    empty = [{}] * len(full)
+
+    baseline = IndexSnapshot(ids, full, empty, empty)
+    truth, _ = run(baseline, queries, args.k)
+
+    print(f"rows: {len(full)}  full dim: {full.shape[1]}  k: {args.k}  queries: {len(queries)}")
+    print(f"{'dims':>5} {'storage':<8} {'rescore':>7} {f'recall@{args.k}':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'index MB':>9} {'vs full':>8}")
+    for dims in (int(d) for d in args.dims.split(",")):
+        dims = min(dims, full.shape[1])
+        shortened = truncateRows(full, dims)
+        for quantization in args.quantization.split(","):
+            factors = [0] if quantization == "float32" else [int(r) for r in args.rescore.split(",")]
+            for rescore in factors:
+                snapshot = IndexSnapshot(ids, shortened, empty, empty, quantization=quantization,
+                                         rescore=rescore, fetch=(lambda rows: shortened[rows]) if rescore else None)
+                found, latencies = run(snapshot, queries, args.k)
+                recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+                print(f"{dims:>5} {quantization:<8} {rescore or '-':>7} {recall:>9.3f} "
+                      f"{np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 95):>8.3f} "
+                      f"{snapshot.nbytes / 2 ** 20:>9.2f} {snapshot.nbytes / baseline.nbytes:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
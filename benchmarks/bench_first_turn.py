@@ -0,0 +1,92 @@
+"""
+Latency and token cost of the first turn with two LLM calls vs. one combined call.
+
+    python benchmarks/bench_first_turn.py --rounds 3 --malformed-rate 0.05
+
+Runs ``pipeline.firstTurn`` over the intent benchmark queries (the seed
+examples in ``intent_classifier``) against the mock OpenAI server in each
+FIRST_TURN_MODE:
+
+- ``parallel``: ``findIntent`` and ``recommQuestion`` sent side by side
+- ``combined``: one JSON-schema call (``utils.intentAndQuestions``)
+
+The local classifier is disabled (INTENT_FAST_THRESHOLD above 1) and the
+response cache is off, so every query reaches the LLM. Reports turn latency,
+upstream LLM requests and input/output tokens per turn as counted by the
+mock, and how many combined answers fell back to two calls because the
+mock cut them off (``--malformed-rate``).
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+
+from harness import ROOT, percentile, startMock
+
+sys.path.insert(0, ROOT)
+
+MODES = ("parallel", "combined")
+
+
+def tokenTotals(metrics):
+    totals = {"input": 0, "output": 0}
+    for (_, kind), value in metrics.LLM_TOKENS._values.items():
+        totals[kind] += value
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", default="lognormal:300:0.3")
+    parser.add_argument("--token-ms", type=float, default=10.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--mock-port", type=int, default=8770)
+    args = parser.parse_args()
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    os.environ.update({"OPENAI_BASE_URL": f"{mock_url}/v1", "OPENAI_API_KEY": "sk-mock",
+                       "INTENT_FAST_THRESHOLD": "1.01", "LLM_CACHE_ENABLED": "0", "EMBEDDING_CACHE_PATH": ""})
+    mock = startMock(args.mock_port, "--latency", args.latency, "--token-ms", args.token_ms,
+                     "--embed-latency", "fixed:20", "--malformed-rate", args.malformed_rate, "--seed", 0)
+    workdir = tempfile.mkdtemp(prefix="skincare-first-turn-")
+    try:
+        import metrics
+        import pipeline
+        from intent_classifier import SEED_EXAMPLES
+        from loadtest import buildStores
+
+        catalog, _ = buildStores(workdir)
+        queries = [query for query, _ in SEED_EXAMPLES]
+        print(f"queries: {len(queries)} x {args.rounds} rounds  malformed rate: {args.malformed_rate}")
+        print(f"{'mode':<9} {'p50 ms':>8} {'p95 ms':>8} {'LLM calls/turn':>15} "
+              f"{'input tok/turn':>15} {'output tok/turn':>16} {'fallbacks':>10}")
+        for mode in MODES:
+            before_stats = httpx.get(f"{mock_url}/mock/stats").json()
+            before_tokens = tokenTotals(metrics)
+            before_fallbacks = metrics.FIRST_TURN_CALLS._values.get(("fallback",), 0)
+            latencies = []
+            for _ in range(args.rounds):
+                for query in queries:
+                    start = time.perf_counter()
+                    pipeline.firstTurn(query, catalog, mode=mode)
+                    latencies.append(time.perf_counter() - start)
+            after_stats = httpx.get(f"{mock_url}/mock/stats").json()
+            tokens = tokenTotals(metrics)
+            turns = len(latencies)
+            calls = after_stats.get("responses", 0) - before_stats.get("responses", 0)
+            fallbacks = metrics.FIRST_TURN_CALLS._values.get(("fallback",), 0) - before_fallbacks
+            print(f"{mode:<9} {percentile(latencies, 50) * 1000:>8.0f} {percentile(latencies, 95) * 1000:>8.0f} "
+                  f"{calls / turns:>15.2f} {(tokens['input'] - before_tokens['input']) / turns:>15.0f} "
+                  f"{(tokens['output'] - before_tokens['output']) / turns:>16.0f} {fallbacks:>10}")
+    finally:
+        mock.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
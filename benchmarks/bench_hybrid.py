@@ -0,0 +1,88 @@
+"""
+Pure-vector vs. hybrid (BM25 + vector) catalog search latency.
+
+    python benchmarks/bench_hybrid.py --repeat 50 --embed-latency lognormal:80:0.3
+
+Builds a throwaway catalog store through the mock OpenAI server, then runs
+``utils.getProducts`` for keyword queries ("serums", "SPF") and longer
+descriptive queries against the plain Chroma collection and against
+``bm25.HybridCatalog``. The embedding cache is disabled so every vector
+query pays its embedding call. Reports p50/p95 latency and embedding calls
+per query, and how often the hybrid top 5 overlaps the vector top 5.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from harness import ROOT, percentile, startMock
+
+sys.path.insert(0, ROOT)
+
+KEYWORD_QUERIES = ["serums", "face-wash", "SPF", "moisturizer", "toner", "sunscreen", "cleanser", "eye cream"]
+LONG_QUERIES = [
+    "something gentle for summer that will not clog my pores",
+    "hydrating serum for dry and flaky skin without fragrance",
+    "night treatment to fade dark spots with retinal",
+    "lightweight sunscreen that leaves no white cast under makeup",
+]
+
+
+def run(search, queries, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--embed-latency", default="lognormal:80:0.3", help="mock embedding latency distribution")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    os.environ.update({
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.port}/v1",
+        "OPENAI_API_KEY": "sk-mock",
+        "EMBEDDING_CACHE_SIZE": "0",
+        "CATALOG_HYBRID": "0",
+    })
+    mock = startMock(args.port, "--embed-latency", args.embed_latency)
+    workdir = tempfile.mkdtemp(prefix="skincare-hybrid-")
+    try:
+        import utils
+        from bm25 import HybridCatalog
+        from embeddings import makeEmbeddingFunction
+        from loadtest import buildStores
+
+        catalog, _ = buildStores(workdir)
+        hybrid = HybridCatalog(catalog)
+        ef = makeEmbeddingFunction()
+
+        print(f"{'queries':<10} {'engine':<8} {'p50 ms':>8} {'p95 ms':>8} {'embeds/query':>13} {'top-5 overlap':>14}")
+        for label, queries in (("keyword", KEYWORD_QUERIES), ("long", LONG_QUERIES)):
+            overlap = []
+            for query in queries:
+                vector_names = {p["Name"] for p in utils.getProducts(query, catalog)}
+                hybrid_names = {p["Name"] for p in utils.getProducts(query, hybrid)}
+                overlap.append(len(vector_names & hybrid_names) / max(1, len(vector_names)))
+            for engine, collection in (("vector", catalog), ("hybrid", hybrid)):
+                before = ef.stats["upstream_calls"]
+                latencies = run(lambda q: utils.getProducts(q, collection), queries, args.repeat)
+                embeds = (ef.stats["upstream_calls"] - before) / len(latencies)
+                shared = f"{sum(overlap) / len(overlap):.0%}" if engine == "hybrid" else "-"
+                print(f"{label:<10} {engine:<8} {percentile(latencies, 50) * 1000:>8.1f} "
+                      f"{percentile(latencies, 95) * 1000:>8.1f} {embeds:>13.2f} {shared:>14}")
+    finally:
+        mock.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares the old per-call ``OpenAI()`` client with the shared pooled clients
+in ``utils`` against the local mock server.
+
+    python benchmarks/bench_llm_client.py --requests 200 --concurrency 50
+
+Three modes are run from inside an asyncio event loop, the way the FastAPI
+endpoints call them:
+
+- legacy:  new ``OpenAI()`` per call, called synchronously (blocks the loop)
+- shared:  ``utils.callLLM`` with the pooled client, still synchronous
+- async:   ``await utils.acallLLM`` with the pooled async client
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from harness import ROOT, percentile, startMock
+
+sys.path.insert(0, ROOT)
+
+
+def legacy_call(prompt):
+    from openai import OpenAI
+    client = OpenAI()
+    response = client.responses.create(model="gpt-4o-mini", input=prompt, temperature=0)
+    return response.output_text
+
+
+async def run_mode(mode, total, concurrency):
+    import utils
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    # Every request is submitted at once, so latency is measured from the
+    # common start and includes time queued behind the semaphore or a
+    # blocked event loop, which is what a caller of the API would observe.
+    async def one(i):
+        async with semaphore:
+            if mode == "legacy":
+                legacy_call(f"serums {i}")
+            elif mode == "shared":
+                utils.callLLM(f"serums {i}")
+            else:
+                await utils.acallLLM(f"serums {i}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "throughput_rps": total / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--modes", default="legacy,shared,async")
+    args = parser.parse_args()
+
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-mock")
+
+    proc = startMock(args.port, "--latency-ms", args.latency_ms, "--token-ms", 0)
+    try:
+        print(f"{'mode':<8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+        for mode in args.modes.split(","):
+            row = asyncio.run(run_mode(mode, args.requests, args.concurrency))
+            print(f"{row['mode']:<8} {row['throughput_rps']:>10.1f} {row['p50_ms']:>10.1f} {row['p99_ms']:>10.1f}")
+    finally:
+        proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+LLM calls under a provider concurrency quota and stragglers, with and without
+``llm_scheduler``.
+
+    python benchmarks/bench_llm_scheduler.py --requests 400 --concurrency 64 --max-concurrency 16
+
+Starts the mock OpenAI server with a concurrency quota (429 above
+``--max-concurrency`` in-flight requests) and a fraction of slow requests,
+then sends the same burst three ways:
+
+- ``sdk``: the OpenAI client's own retries (2, exponential backoff), no limit
+- ``scheduler``: ``LLMScheduler`` with the adaptive limiter and jittered retries
+- ``hedged``: the same plus a duplicate request after the recent p95
+
+Reports success rate, latency percentiles, upstream requests and 429s per
+successful call, and where the adaptive limit settled.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from harness import ROOT, percentile, startMock
+
+sys.path.insert(0, ROOT)
+
+
+def burst(call, requests, concurrency):
+    latencies, errors = [], {}
+
+    def one(n):
+        started = time.perf_counter()
+        try:
+            call(f"Suggest a serum, request {n}")
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64, help="client threads")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="mock provider quota")
+    parser.add_argument("--latency", default="lognormal:150:0.2")
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--deadline", type=float, default=15.0)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    os.environ.update({"OPENAI_BASE_URL": f"{base_url}/v1", "OPENAI_API_KEY": "sk-mock"})
+    mock = startMock(args.port, "--latency", args.latency, "--token-ms", 1, "--seed", 7,
+                     "--max-concurrency", args.max_concurrency, "--retry-after", args.retry_after,
+                     "--slow-rate", args.slow_rate, "--slow-ms", args.slow_ms)
+    try:
+        from openai import OpenAI
+        from llm_scheduler import AdaptiveLimiter, LLMScheduler
+
+        limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+        sdk_client = OpenAI(http_client=httpx.Client(limits=limits, timeout=args.deadline))
+        raw_client = OpenAI(max_retries=0, http_client=httpx.Client(limits=limits, timeout=args.deadline))
+
+        def create(client, prompt, timeout):
+            return client.responses.create(model="gpt-4o-mini", input=prompt, temperature=0, timeout=timeout)
+
+        def scheduled(hedge):
+            scheduler = LLMScheduler(AdaptiveLimiter(initial=args.concurrency, maximum=args.concurrency * 2),
+                                     max_retries=6, deadline=args.deadline, hedge=hedge)
+            return scheduler, lambda prompt: scheduler.call(lambda timeout: create(raw_client, prompt, timeout))
+
+        modes = [("sdk", None, lambda prompt: create(sdk_client, prompt, args.deadline))]
+        modes += [(name, *scheduled(hedge)) for name, hedge in (("scheduler", False), ("hedged", True))]
+
+        print(f"{'mode':<10} {'ok':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'upstream/ok':>12} {'429s/ok':>8} {'limit':>6}  errors")
+        for name, scheduler, call in modes:
+            before = httpx.get(f"{base_url}/mock/stats").json()
+            latencies, errors = burst(call, args.requests, args.concurrency)
+            after = httpx.get(f"{base_url}/mock/stats").json()
+            ok = max(1, len(latencies))
+            upstream = after.get("responses", 0) - before.get("responses", 0)
+            throttled = after.get("rate_limited", 0) - before.get("rate_limited", 0)
+            limit = f"{int(scheduler.limiter.limit)}" if scheduler else "-"
+            print(f"{name:<10} {len(latencies) / args.requests:>6.1%} {percentile(latencies, 50) * 1000:>8.0f} "
+                  f"{percentile(latencies, 95) * 1000:>8.0f} {percentile(latencies, 99) * 1000:>8.0f} "
+                  f"{upstream / ok:>12.2f} {throttled / ok:>8.2f} {limit:>6}  {errors or ''}")
+    finally:
+        mock.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Import time and API cold start.
+
+    python benchmarks/bench_startup.py --runs 5
+
+Import time is measured in fresh interpreters for the modules the entry
+points load. Cold start launches ``uvicorn api:app`` against the mock OpenAI
+server and a throwaway catalog, and reports the time until it accepts
+requests (imports plus the startup warm-up) and the latency of the first and
+second ``/api/products`` call, without and with API_WARMUP_QUERY.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from harness import ROOT, startApi, startMock
+
+sys.path.insert(0, ROOT)
+
+MODULES = ["resources", "utils", "pipeline", "api"]
+WARMUP_QUERY = "hydrating serum for dry skin"
+
+
+def importSeconds(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.check_output([sys.executable, "-W", "ignore", "-c", code], cwd=ROOT, text=True)
+    return float(out.strip().splitlines()[-1])
+
+
+def coldStart(port, env):
+    started = time.perf_counter()
+    api = startApi(port, env, timeout=120)
+    ready = time.perf_counter() - started
+    try:
+        latencies = []
+        for _ in range(2):
+            start = time.perf_counter()
+            httpx.post(f"http://127.0.0.1:{port}/api/products", json={"query": WARMUP_QUERY}, timeout=60).raise_for_status()
+            latencies.append(time.perf_counter() - start)
+    finally:
+        api.terminate()
+        api.wait()
+    return ready, latencies[0], latencies[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--embed-latency", default="fixed:80")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--mock-port", type=int, default=8769)
+    args = parser.parse_args()
+
+    print(f"{'module':<10} {'import ms (median)':>18}")
+    for module in MODULES:
+        print(f"{module:<10} {statistics.median(importSeconds(module) for _ in range(args.runs)) * 1000:>18.0f}")
+
+    os.environ.update({"OPENAI_BASE_URL": f"http://127.0.0.1:{args.mock_port}/v1", "OPENAI_API_KEY": "sk-mock"})
+    mock = startMock(args.mock_port, "--embed-latency", args.embed_latency)
+    workdir = tempfile.mkdtemp(prefix="skincare-startup-")
+    try:
+        from loadtest import buildStores
+
+        buildStores(workdir)
+        print(f"\n{'warm-up':<10} {'ready ms':>9} {'1st request ms':>15} {'2nd request ms':>15}")
+        for label, query in (("off", ""), ("query", WARMUP_QUERY)):
+            runs = [coldStart(args.port, {"CATALOG_PATH": os.path.join(workdir, "catalog"), "API_WARMUP_QUERY": query,
+                                          "LLM_CACHE_PATH": "", "EMBEDDING_CACHE_PATH": ""})
+                    for _ in range(args.runs)]
+            ready, first, second = (statistics.median(values) * 1000 for values in zip(*runs))
+            print(f"{label:<10} {ready:>9.0f} {first:>15.1f} {second:>15.1f}")
+    finally:
+        mock.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Micro-benchmark: Chroma ``collection.query`` vs. the in-process NumPy index.
+
+    python benchmarks/bench_vector_index.py --path catalog --queries 500
+    python benchmarks/bench_vector_index.py --synthetic 50000   # scale test
+
+Query vectors are stored catalog embeddings plus a little noise, so no
+embedding API calls are made. With ``--synthetic N`` the catalog matrix is
+tiled with noise up to N rows for the NumPy side only.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import chromadb  # noqa: E402
+from vector_index import CatalogIndex, IndexSnapshot  # noqa: E402
+
+
+def timed(fn, queries):
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), len(queries) / (latencies.sum() / 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=os.path.join(ROOT, "catalog"))
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--synthetic", type=int, default=0)
+    args = parser.parse_args()
+
+    collection = chromadb.PersistentClient(path=args.path).get_collection("catalogs")
+    index = CatalogIndex(collection, embedding_function=lambda texts: [])
+    base = index.snapshot.matrix
+    rng = np.random.default_rng(0)
+    queries = base[rng.integers(0, len(base), args.queries)] + rng.normal(0, 0.01, (args.queries, base.shape[1])).astype(np.float32)
+
+    def chroma_query(q):
+        collection.query(query_embeddings=[q.tolist()], n_results=args.k, include=["metadatas", "distances"])
+
+    def numpy_query(q):
+        index.query(query_embeddings=[q], n_results=args.k)
+
+    print(f"rows: {len(base)}  dim: {base.shape[1]}  k: {args.k}")
+    print(f"{'engine':<10} {'p50 ms':>8} {'p99 ms':>8} {'q/s':>10}")
+    for name, fn in (("chroma", chroma_query), ("numpy", numpy_query)):
+        p50, p99, qps = timed(fn, queries)
+        print(f"{name:<10} {p50:>8.3f} {p99:>8.3f} {qps:>10.0f}")
+
+    if args.synthetic:
+        reps = -(-args.synthetic // len(base))
+        matrix = np.tile(base, (reps, 1))[:args.synthetic]
+        matrix = matrix + rng.normal(0, 0.01, matrix.shape).astype(np.float32)
+        metas = (index.snapshot.metadatas * reps)[:args.synthetic]
+        snapshot = IndexSnapshot([str(i) for i in range(args.synthetic)], matrix, metas, [""] * args.synthetic)
+        p50, p99, qps = timed(lambda q: snapshot.topk(q, args.k), queries[:100])
+        print(f"{'numpy@' + str(args.synthetic):<10} {p50:>8.3f} {p99:>8.3f} {qps:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
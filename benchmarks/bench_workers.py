@@ -0,0 +1,138 @@
+"""
+Requests/sec and memory of the API as the worker count grows, per catalog engine.
+
+    python benchmarks/bench_workers.py --rows 10000 --workers 1,2,4 --engines chroma,numpy,mmap
+
+Builds a synthetic catalog of ``--rows`` products (the real catalog rows
+repeated, embedded offline with the same hashing embeddings the mock server
+returns), exports it with ``mapped_index.exportIndex``, then for every engine
+and worker count starts ``uvicorn api:app --workers N`` against the mock
+OpenAI server and drives ``/api/products``.
+
+Memory is summed over the uvicorn master and its workers from /proc: RSS
+counts shared pages once per process, PSS splits them between the processes
+sharing them, so PSS is the figure to compare. Linux only.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from harness import ROOT, startApi, startMock
+
+sys.path.insert(0, ROOT)
+
+QUERIES = ["hydrating serum for dry skin", "oil free moisturizer", "gentle cleanser", "vitamin c serum",
+           "sunscreen for sensitive skin", "night cream with retinol", "toner for oily skin", "eye cream"]
+
+
+def buildCatalog(path, rows, batch_size=2000):
+    import chromadb
+    import catalogDB
+    from embeddings import hashingEmbedding
+
+    ids, documents, metadatas = catalogDB.buildRecords(catalogDB.loadCatalog(os.path.join(ROOT, catalogDB.DEFAULT_FILE)))
+    collection = chromadb.PersistentClient(path=path).create_collection("catalogs", embedding_function=None)
+    base = np.stack([hashingEmbedding(doc) for doc in documents])
+    rng = np.random.default_rng(0)
+    for start in range(0, rows, batch_size):
+        n = np.arange(start, min(rows, start + batch_size))
+        vectors = base[n % len(base)] + rng.normal(0, 0.005, (len(n), base.shape[1])).astype(np.float32)
+        collection.add(
+            ids=[f"{ids[i % len(ids)]}-{i}" for i in n],
+            documents=[documents[i % len(ids)] for i in n],
+            metadatas=[dict(metadatas[i % len(ids)], Name=f"{metadatas[i % len(ids)]['Name']} #{i}") for i in n],
+            embeddings=vectors,
+        )
+    return collection
+
+
+def processTree(pid):
+    """``pid`` and all of its descendants."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def memoryMB(pid):
+    """Total (RSS, PSS) in MB of a process tree."""
+    rss = pss = 0
+    for member in processTree(pid):
+        try:
+            with open(f"/proc/{member}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            continue
+    return rss / 1024, pss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--engines", default="chroma,numpy,mmap")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--mock-port", type=int, default=8768)
+    args = parser.parse_args()
+
+    os.environ.update({"OPENAI_BASE_URL": f"http://127.0.0.1:{args.mock_port}/v1", "OPENAI_API_KEY": "sk-mock"})
+    mock = startMock(args.mock_port, "--embed-latency", "fixed:5")
+    workdir = tempfile.mkdtemp(prefix="skincare-workers-")
+    try:
+        from loadtest import driveEndpoint
+        from mapped_index import exportIndex
+
+        catalog_path, index_path = os.path.join(workdir, "catalog"), os.path.join(workdir, "index")
+        collection = buildCatalog(catalog_path, args.rows)
+        exportIndex(collection, index_path)
+        print(f"rows: {args.rows}  matrix: {args.rows * 3072 * 4 / 2 ** 20:.0f} MB float32")
+
+        print(f"{'engine':<8} {'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'RSS MB':>8} {'PSS MB':>8} {'PSS/worker':>10}")
+        body = lambda i: {"query": QUERIES[i % len(QUERIES)]}  # noqa: E731
+        for engine in args.engines.split(","):
+            for workers in (int(w) for w in args.workers.split(",")):
+                env = {"CATALOG_ENGINE": engine, "CATALOG_PATH": catalog_path, "CATALOG_INDEX_PATH": index_path,
+                       "LLM_CACHE_PATH": "", "EMBEDDING_CACHE_PATH": ""}
+                api = startApi(args.port, env, workers=workers, timeout=300)
+                try:
+                    base_url = f"http://127.0.0.1:{args.port}"
+                    # Every worker opens its catalog on startup; the warm-up pass fills the page cache
+                    asyncio.run(driveEndpoint(base_url, "/api/products", body, args.requests // 2, args.concurrency))
+                    stats = asyncio.run(driveEndpoint(base_url, "/api/products", body, args.requests, args.concurrency))
+                    rss, pss = memoryMB(api.pid)
+                finally:
+                    api.terminate()
+                    api.wait()
+                print(f"{engine:<8} {workers:>7} {stats['throughput_rps']:>8.1f} {stats['p50_ms']:>8.1f} "
+                      f"{stats['p99_ms']:>8.1f} {rss:>8.0f} {pss:>8.0f} {pss / workers:>10.0f}"
+                      + (f"  errors: {stats['errors']}" if stats["errors"] else ""))
+    finally:
+        mock.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
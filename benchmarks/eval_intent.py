@@ -0,0 +1,93 @@
+"""
+Evaluates the local intent classifier against LLM labels.
+
+    python benchmarks/eval_intent.py --labels intent_log.jsonl
+    python benchmarks/eval_intent.py --queries queries.txt --live   # label with findIntent first
+
+Labels are JSONL records ``{"query": ..., "intent": ...}`` as written to
+INTENT_LOG_PATH. With no labels the seed examples are evaluated
+leave-one-out. For each threshold the report shows the share of LLM calls
+the fast path avoids, agreement with the LLM on those confident answers, and
+end-to-end agreement once low-confidence queries fall back to the LLM.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import intent_classifier  # noqa: E402
+
+
+def cross_validated_predictions(examples, folds, extra_training):
+    predictions = []
+    for fold in range(folds):
+        test = [ex for i, ex in enumerate(examples) if i % folds == fold]
+        train = [ex for i, ex in enumerate(examples) if i % folds != fold]
+        model = intent_classifier.IntentClassifier().fit(extra_training + train).calibrate(extra_training + train)
+        for query, label in test:
+            predicted, confidence = model.predict(query)
+            predictions.append((label, predicted, confidence))
+    return predictions
+
+
+def label_live(path):
+    import utils
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            query = line.strip()
+            if query:
+                label = intent_classifier.normalizeLabel(utils.findIntent(query))
+                if label:
+                    examples.append((query, label))
+    return examples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", default=os.getenv("INTENT_LOG_PATH"))
+    parser.add_argument("--queries", help="plain-text queries, one per line, labeled with --live")
+    parser.add_argument("--live", action="store_true", help="label --queries with findIntent")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--thresholds", default="0.8,0.9,0.95,0.97,0.99,0.995")
+    parser.add_argument("--save", help="write the model trained on all examples here (INTENT_MODEL_PATH)")
+    args = parser.parse_args()
+
+    if args.live and args.queries:
+        examples, extra = label_live(args.queries), intent_classifier.SEED_EXAMPLES
+    elif args.labels and os.path.exists(args.labels):
+        examples, extra = intent_classifier.loadExamples(args.labels), intent_classifier.SEED_EXAMPLES
+    else:
+        examples, extra = list(intent_classifier.SEED_EXAMPLES), []
+        args.folds = len(examples)
+
+    if not examples:
+        sys.exit("no labeled examples to evaluate")
+
+    predictions = cross_validated_predictions(examples, min(args.folds, len(examples)), extra)
+    model = intent_classifier.IntentClassifier().fit(extra + examples).calibrate(extra + examples)
+    if args.save:
+        model.save(args.save)
+    start = time.perf_counter()
+    for query, _ in examples:
+        model.predict(query)
+    per_query_us = (time.perf_counter() - start) / len(examples) * 1e6
+
+    overall = sum(label == predicted for label, predicted, _ in predictions) / len(predictions)
+    print(f"examples: {len(predictions)}  local accuracy: {overall:.3f}  predict: {per_query_us:.1f} us/query  "
+          f"temperature: {model.temperature:.2f}")
+    print(f"{'threshold':>9} {'avoided':>8} {'agree(fast)':>12} {'agree(total)':>13}")
+    for threshold in [float(t) for t in args.thresholds.split(",")]:
+        confident = [(l, p) for l, p, c in predictions if c >= threshold]
+        avoided = len(confident) / len(predictions)
+        agree_fast = sum(l == p for l, p in confident) / len(confident) if confident else 1.0
+        # Fallback queries get the LLM's own label, so they always agree.
+        agree_total = (sum(l == p for l, p in confident) + len(predictions) - len(confident)) / len(predictions)
+        print(f"{threshold:>9.3f} {avoided:>8.1%} {agree_fast:>12.1%} {agree_total:>13.1%}")
+
+
+if __name__ == "__main__":
+    main()
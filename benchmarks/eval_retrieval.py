@@ -0,0 +1,198 @@
+"""
+Retrieval quality vs. latency and memory of Chroma HNSW settings, offline.
+
+    python benchmarks/eval_retrieval.py --distractors 20000 --m 8,16,32 --ef-search 10,50,100 --builds 3
+    python benchmarks/eval_retrieval.py --save-golden golden.jsonl
+
+The golden set is built from the catalog spreadsheet: a product's name and
+its description should each find that product, ``<category> for <tag>``
+the products of that category carrying the tag, and ``<category> with
+<ingredient>`` the products of that category listing the ingredient.
+``--golden`` reads a hand-edited set instead, as JSONL records
+``{"query": ..., "kind": ..., "expected": [product ids]}``.
+
+Vectors come from ``embeddings.HashingEmbeddingFunction``, so nothing is
+sent over the network and runs are repeatable. The absolute numbers say
+little about text-embedding-3 quality; compare settings against the
+``exact`` row, a brute-force search over the same vectors. The catalog is
+small enough for Chroma to search exhaustively, so ``--distractors`` adds
+that many rows of catalog vocabulary for the HNSW graph to be built over.
+
+Every combination of distance space, M, ef_construction and ef_search gets
+its own catalog collection, created through ``ingest.openCollection``:
+Chroma only applies ef_search when it loads an index, and graph
+construction is not deterministic, so ``--builds`` averages several builds
+and shows the recall range. Each query runs ``utils.getCandidates``, the nearest-neighbour query behind
+``getProducts``, so latency includes embedding the query. recall@5 is
+measured on the products getProducts would return and MRR on the rank of
+the first expected product. Index MB is the size of the HNSW segment files,
+which Chroma holds in memory (they are written once a collection passes
+1000 rows).
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from harness import ROOT, percentile
+
+sys.path.insert(0, ROOT)
+
+import chromadb  # noqa: E402
+import catalogDB  # noqa: E402
+import utils  # noqa: E402
+from embeddings import HashingEmbeddingFunction  # noqa: E402
+from ingest import indexConfiguration, openCollection  # noqa: E402
+
+K = 5
+
+
+def buildGoldenSet(df):
+    """Queries with the product ids they should retrieve, derived from catalog rows."""
+    rows = df.to_dict("records")
+    golden = []
+    for row in rows:
+        golden.append({"query": row["name"], "kind": "name", "expected": [row["product_id"]]})
+        golden.append({"query": row["description"], "kind": "description", "expected": [row["product_id"]]})
+
+    def tags(row):
+        return {t.strip() for t in row["tags"].split("|") if t.strip()}
+
+    def ingredients(row):
+        return {i.strip().lower() for i in row["top_ingredients"].split(";") if i.strip()}
+
+    for category in sorted({row["category"] for row in rows}):
+        members = [row for row in rows if row["category"] == category]
+        for tag in sorted(set().union(*(tags(row) for row in members))):
+            golden.append({"query": f"{category} for {tag.replace('-', ' ')}", "kind": "category_tag",
+                           "expected": [row["product_id"] for row in members if tag in tags(row)]})
+        for ingredient in sorted(set().union(*(ingredients(row) for row in members))):
+            golden.append({"query": f"{category} with {ingredient}", "kind": "ingredient",
+                           "expected": [row["product_id"] for row in members if ingredient in ingredients(row)]})
+    return golden
+
+
+def loadGolden(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def distractorRows(documents, n, rng, words=12):
+    """``n`` rows of random catalog vocabulary that are never expected."""
+    vocabulary = sorted({word for doc in documents for word in doc.replace(".", " ").split()})
+    ids = [f"distractor-{i}" for i in range(n)]
+    texts = [" ".join(rng.choice(vocabulary, words)) for _ in range(n)]
+    metadatas = [{"price": 0, "margin": 0.0, "Name": f"Distractor {i}", "category": "Distractor"} for i in range(n)]
+    return ids, texts, metadatas
+
+
+def buildCollection(path, index, ef, ids, documents, metadatas, vectors, batch_size=5000):
+    collection = openCollection(chromadb.PersistentClient(path=path), catalogDB.COLLECTION_NAME, ef, index=index)
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.add(ids=ids[start:end], documents=documents[start:end],
+                       metadatas=metadatas[start:end], embeddings=vectors[start:end])
+    return collection
+
+
+def indexMB(path):
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_dir():
+            total += sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+    return total / 2 ** 20
+
+
+def score(ranked, expected):
+    """(recall@K on the returned set, reciprocal rank of the first expected id)."""
+    hits = [i for i, record_id in enumerate(ranked) if record_id in expected]
+    recall = len({ranked[i] for i in hits if i < K}) / min(K, len(expected))
+    return recall, 1.0 / (hits[0] + 1) if hits else 0.0
+
+
+def evaluate(search, golden):
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for item in golden:
+        start = time.perf_counter()
+        ranked = search(item["query"])
+        latencies.append(time.perf_counter() - start)
+        recall, rr = score(ranked, set(item["expected"]))
+        recalls.append(recall)
+        reciprocal_ranks.append(rr)
+    return float(np.mean(recalls)), float(np.mean(reciprocal_ranks)), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default=os.path.join(ROOT, catalogDB.DEFAULT_FILE))
+    parser.add_argument("--golden", help="JSONL golden set to use instead of the one built from --file")
+    parser.add_argument("--save-golden", help="write the golden set built from --file here and exit")
+    parser.add_argument("--distractors", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=1024, help="hashing embedding size")
+    parser.add_argument("--spaces", default="l2,cosine")
+    parser.add_argument("--m", default="8,32")
+    parser.add_argument("--ef-construction", default="50,200")
+    parser.add_argument("--ef-search", default="10,100")
+    parser.add_argument("--builds", type=int, default=1, help="independent builds averaged per setting")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = catalogDB.loadCatalog(args.file)
+    golden = loadGolden(args.golden) if args.golden else buildGoldenSet(df)
+    if args.save_golden:
+        with open(args.save_golden, "w", encoding="utf-8") as f:
+            for item in golden:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        print(f"Wrote {len(golden)} queries to {args.save_golden}")
+        return
+
+    ef = HashingEmbeddingFunction(args.dim)
+    ids, documents, metadatas = catalogDB.buildRecords(df)
+    extra_ids, extra_docs, extra_meta = distractorRows(documents, args.distractors, np.random.default_rng(args.seed))
+    ids, documents, metadatas = ids + extra_ids, documents + extra_docs, metadatas + extra_meta
+    start = time.perf_counter()
+    vectors = np.stack(ef(documents))
+    print(f"rows: {len(ids)} ({args.distractors} distractors)  dim: {args.dim}  "
+          f"queries: {len(golden)}  embedded in {time.perf_counter() - start:.1f}s")
+
+    # Hashing vectors are unit length, so l2, cosine and ip all rank like the dot product
+    exact = lambda query: [ids[i] for i in np.argsort(-(vectors @ ef([query])[0]))[:K]]  # noqa: E731
+    recall, mrr, latencies = evaluate(exact, golden)
+    print(f"{'space':<7} {'M':>3} {'ef_c':>5} {'ef_s':>5} {'build s':>8} {'index MB':>9} "
+          f"{f'recall@{K}':>9} {'MRR':>6} {'p50 ms':>7} {'p95 ms':>7}")
+    print(f"{'exact':<7} {'-':>3} {'-':>5} {'-':>5} {'-':>8} {vectors.nbytes / 2 ** 20:>9.1f} "
+          f"{recall:>9.3f} {mrr:>6.3f} {percentile(latencies, 50) * 1000:>7.2f} {percentile(latencies, 95) * 1000:>7.2f}")
+
+    grid = itertools.product(args.spaces.split(","), [int(m) for m in args.m.split(",")],
+                             [int(e) for e in args.ef_construction.split(",")],
+                             [int(e) for e in args.ef_search.split(",")])
+    for space, m, ef_construction, ef_search in grid:
+        index = indexConfiguration(space, m, ef_construction, ef_search)
+        recalls, mrrs, latencies, build_seconds, sizes = [], [], [], [], []
+        for _ in range(args.builds):
+            workdir = tempfile.mkdtemp(prefix="skincare-retrieval-")
+            try:
+                start = time.perf_counter()
+                collection = buildCollection(workdir, index, ef, ids, documents, metadatas, vectors)
+                build_seconds.append(time.perf_counter() - start)
+                sizes.append(indexMB(workdir))
+                recall, mrr, build_latencies = evaluate(
+                    lambda query: [c["id"] for c in utils.getCandidates(query, collection, pool_size=K)], golden)
+                recalls.append(recall)
+                mrrs.append(mrr)
+                latencies.extend(build_latencies)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+        spread = f"  ({min(recalls):.3f}-{max(recalls):.3f})" if args.builds > 1 else ""
+        print(f"{space:<7} {m:>3} {ef_construction:>5} {ef_search:>5} {np.mean(build_seconds):>8.1f} "
+              f"{np.mean(sizes):>9.1f} {np.mean(recalls):>9.3f} {np.mean(mrrs):>6.3f} "
+              f"{percentile(latencies, 50) * 1000:>7.2f} {percentile(latencies, 95) * 1000:>7.2f}{spread}")
+
+if __name__ == "__main__":
+    main()
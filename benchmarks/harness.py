@@ -0,0 +1,70 @@
+"""
+Shared helpers for the benchmark scripts: percentiles, and starting the mock
+OpenAI server or the API as subprocesses.
+"""
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (ms) for one stage."""
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def waitFor(url, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"process for {url} exited with {proc.returncode}")
+        try:
+            httpx.get(url, timeout=2)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError(f"{url} did not come up")
+
+
+def startMock(port, *args):
+    """Starts benchmarks/mock_openai.py; extra CLI ``args`` are passed through."""
+    proc = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "mock_openai.py"),
+        "--port", str(port), *[str(a) for a in args],
+    ])
+    waitFor(f"http://127.0.0.1:{port}/mock/stats", proc)
+    return proc
+
+
+def startApi(port, env, workers=1, timeout=60):
+    """Starts ``uvicorn api:app`` from the repo root with the given environment."""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT,
+        env=dict(os.environ, **env),
+    )
+    waitFor(f"http://127.0.0.1:{port}/docs", proc, timeout=timeout)
+    return proc
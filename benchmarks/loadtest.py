@@ -0,0 +1,243 @@
+"""
+Offline load test of the ``utils`` functions and the ``api.py`` endpoints.
+
+    python benchmarks/loadtest.py --target utils --concurrency 16 --requests 200
+    python benchmarks/loadtest.py --target api --latency lognormal:300:0.4 --error-rate 0.01
+    python benchmarks/loadtest.py --compare baseline.json bench_results.json
+
+Everything runs against ``benchmarks/mock_openai.py``: a throwaway catalog and
+docs store are built from the files in ``Data/`` with the mock's deterministic
+embeddings, so no OpenAI access is needed. Response and embedding caches are
+disabled unless ``--cache`` is given, so every request pays its upstream calls.
+
+Each stage reports throughput, error rate and p50/p95/p99 latency. Results
+are written as JSON (``--output``) together with the git commit and settings,
+and ``--compare`` prints the change between two such files.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from harness import ROOT, startApi, startMock, summarize
+
+sys.path.insert(0, ROOT)
+
+QUERIES = [
+    "serums", "moisturizers", "sunscreen for oily skin", "something gentle for summer",
+    "I want to buy face-wash", "night cream for dry skin", "vitamin c serum", "toner for acne",
+]
+QUESTIONS = [
+    "What is the brand philosophy?", "How is the BHA serum for sensitive skin?",
+    "What happened to my support ticket?", "Do reviewers like the night cream?",
+]
+ANSWERS = "- Skin concern: hydration\n- Skin type: dry\n- Preference: fragrance-free"
+
+
+def gitCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def buildStores(workdir):
+    """Ingests the catalog and docs into ``workdir`` using the mock embeddings."""
+    import chromadb
+    import catalogDB
+    import docsDB
+    from embeddings import makeEmbeddingFunction
+    from ingest import syncRecords
+
+    ef = makeEmbeddingFunction()
+    catalog = chromadb.PersistentClient(path=os.path.join(workdir, "catalog")).get_or_create_collection(
+        name="catalogs", embedding_function=ef)
+    catalogDB.syncCatalog(catalog, catalogDB.loadCatalog(os.path.join(ROOT, catalogDB.DEFAULT_FILE)), ef)
+    docs = chromadb.PersistentClient(path=os.path.join(workdir, "docs")).get_or_create_collection(
+        name="docs", embedding_function=ef)
+    ids, documents, metadatas = docsDB.extractRecords(os.path.join(ROOT, docsDB.DEFAULT_FILE))
+    syncRecords(docs, ids, documents, metadatas, ef)
+    return catalog, docs
+
+
+def runThreaded(fn, total, concurrency):
+    latencies, errors = [], 0
+
+    def one(i):
+        start = time.perf_counter()
+        fn(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(one, i) for i in range(total)]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                errors += 1
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def utilsStages(catalog, docs):
+    import pipeline
+    import utils
+
+    hits = docs.query(query_texts=[QUESTIONS[0]], n_results=5)
+    pick = lambda items, i: items[i % len(items)]  # noqa: E731
+    return {
+        "findIntent": lambda i: utils.findIntent(pick(QUERIES, i)),
+        "recommQuestion": lambda i: utils.recommQuestion(pick(QUERIES, i)),
+        "recommFinalQuery": lambda i: utils.recommFinalQuery(pick(QUERIES, i), ANSWERS),
+        "RAG": lambda i: utils.RAG(hits, pick(QUESTIONS, i)),
+        "getProducts": lambda i: utils.getProducts(pick(QUERIES, i), catalog),
+        "docsQuery": lambda i: docs.query(query_texts=[pick(QUESTIONS, i)], n_results=5),
+        "firstTurn": lambda i: pipeline.firstTurn(pick(QUERIES + QUESTIONS, i), catalog, docs),
+    }
+
+
+def apiRequests():
+    pick = lambda items, i: items[i % len(items)]  # noqa: E731
+    return {
+        "/api/intent": lambda i: {"query": pick(QUERIES + QUESTIONS, i)},
+        "/api/recommendation/questions": lambda i: {"query": pick(QUERIES, i)},
+        "/api/recommendation/final": lambda i: {"query": pick(QUERIES, i), "answers": ANSWERS},
+        "/api/rag": lambda i: {"results": {"documents": ["The brand believes in gentle, effective skincare."]},
+                               "user_question": pick(QUESTIONS, i)},
+        "/api/products": lambda i: {"query": pick(QUERIES, i)},
+        "/api/recommendation/start": lambda i: {"query": pick(QUERIES, i)},
+    }
+
+
+async def driveEndpoint(base_url, path, body_for, total, concurrency):
+    import httpx
+
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, json=body_for(i))
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except Exception:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old_path} ({old['meta'].get('commit')}) -> {new_path} ({new['meta'].get('commit')})")
+    print(f"{'stage':<32} {'rps':>16} {'p50 ms':>18} {'p99 ms':>18}")
+    for stage, now in new["stages"].items():
+        before = old["stages"].get(stage)
+        if before is None:
+            continue
+
+        def cell(key):
+            a, b = before[key], now[key]
+            change = (b - a) / a * 100 if a else 0.0
+            return f"{b:>8.1f} ({change:+5.0f}%)"
+
+        print(f"{stage:<32} {cell('throughput_rps'):>16} {cell('p50_ms'):>18} {cell('p99_ms'):>18}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["utils", "api", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=100, help="requests per stage")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stages", help="comma-separated subset of stage names")
+    parser.add_argument("--latency", default="lognormal:300:0.4", help="mock LLM latency distribution")
+    parser.add_argument("--embed-latency", default="lognormal:80:0.3")
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="keep response and embedding caches enabled")
+    parser.add_argument("--mock-port", type=int, default=8765)
+    parser.add_argument("--api-port", type=int, default=8001)
+    parser.add_argument("--api-workers", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="skincare-bench-")
+    env = {
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.mock_port}/v1",
+        "OPENAI_API_KEY": "sk-mock",
+        "CATALOG_PATH": os.path.join(workdir, "catalog"),
+        "DOCS_PATH": os.path.join(workdir, "docs"),
+        "LLM_CACHE_PATH": "",
+    }
+    if not args.cache:
+        env.update({"LLM_CACHE_ENABLED": "0", "EMBEDDING_CACHE_SIZE": "0"})
+    os.environ.update(env)
+
+    mock = startMock(
+        args.mock_port, "--latency", args.latency, "--embed-latency", args.embed_latency,
+        "--token-ms", args.token_ms, "--error-rate", args.error_rate,
+        "--rate-limit-rate", args.rate_limit_rate, "--seed", args.seed,
+    )
+    api = None
+    results = {}
+    wanted = set(args.stages.split(",")) if args.stages else None
+    try:
+        catalog, docs = buildStores(workdir)
+
+        if args.target in ("utils", "both"):
+            for name, fn in utilsStages(catalog, docs).items():
+                if wanted and name not in wanted:
+                    continue
+                results[f"utils.{name}"] = runThreaded(fn, args.requests, args.concurrency)
+                print(f"utils.{name:<28} {json.dumps({k: round(v, 2) for k, v in results[f'utils.{name}'].items()})}")
+
+        if args.target in ("api", "both"):
+            api = startApi(args.api_port, env, workers=args.api_workers)
+            base_url = f"http://127.0.0.1:{args.api_port}"
+            for path, body_for in apiRequests().items():
+                if wanted and path not in wanted:
+                    continue
+                results[path] = asyncio.run(driveEndpoint(base_url, path, body_for, args.requests, args.concurrency))
+                print(f"{path:<34} {json.dumps({k: round(v, 2) for k, v in results[path].items()})}")
+    finally:
+        if api is not None:
+            api.terminate()
+        mock.terminate()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": gitCommit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+        },
+        "stages": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Local stand-in for the OpenAI API used by the benchmarks.
+
+Point the SDK at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any
+OPENAI_API_KEY. It implements:
+
+- ``POST /v1/responses``: canned answers (``stream=True`` gets server-sent
+  events with one delta per word every ``--token-ms``); a ``json_schema``
+  text format gets a JSON first-turn answer, of which ``--malformed-rate``
+  are cut off mid-object
+- ``POST /v1/embeddings``: deterministic hashed embeddings (``float`` or
+  ``base64``, honouring ``dimensions``)
+
+Latency is drawn from a distribution spec such as ``fixed:200``,
+``uniform:100:400``, ``normal:200:50`` or ``lognormal:200:0.5`` (median ms,
+sigma). ``--error-rate`` answers that fraction of requests with a 500 and
+``--rate-limit-rate`` with a 429 carrying ``retry-after``. ``--max-concurrency``
+answers with a 429 whenever more LLM requests than that are in flight, like a
+provider's concurrency quota, and ``--slow-rate`` makes that fraction of LLM
+requests stragglers that take an extra ``--slow-ms``. Settings can be
+changed at runtime with ``POST /mock/config`` and counters read from
+``GET /mock/stats``.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import hashingEmbedding  # noqa: E402
+
+app = FastAPI(title="Mock OpenAI")
+app.state.config = {
+    "latency": "fixed:200",
+    "embed_latency": "fixed:50",
+    "token_ms": 20.0,
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "retry_after": 1.0,
+    "max_concurrency": 0,
+    "slow_rate": 0.0,
+    "slow_ms": 0.0,
+    "malformed_rate": 0.0,
+    "seed": None,
+}
+app.state.inflight = 0
+app.state.stats = Counter()
+app.state.rng = random.Random()
+
+LONG_ANSWER = (
+    "1. What skin concern are you targeting—hydration, blemishes, or something else?\n"
+    "2. How would you describe your skin type—oily, dry, combination or sensitive?\n"
+    "3. Any ingredients you love or want to avoid?"
+)
+
+FINAL_QUERY = (
+    "Category: Serum\n"
+    "Description: Looking for a hydrating serum suitable for dry skin, preferably fragrance-free.\n"
+    "Top Ingredients: Hyaluronic acid, glycerin\n"
+    "Tags: dry skin, hydration, fragrance-free"
+)
+
+
+def sample_ms(spec):
+    """Draws one latency in milliseconds from a ``kind:arg[:arg]`` spec."""
+    kind, *args = str(spec).split(":")
+    args = [float(a) for a in args]
+    rng = app.state.rng
+    if kind == "fixed":
+        return args[0]
+    if kind == "uniform":
+        return rng.uniform(args[0], args[1])
+    if kind == "normal":
+        return max(0.0, rng.gauss(args[0], args[1]))
+    if kind == "lognormal":
+        import math
+        return args[0] * math.exp(rng.gauss(0.0, args[1]))
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+def answer_for(prompt):
+    text = str(prompt)
+    if "Classify the following user query" in text:
+        return "Recommendation"
+    if "structured, enriched query" in text:
+        return FINAL_QUERY
+    return LONG_ANSWER
+
+
+def structured_answer(prompt):
+    """JSON for a json_schema request: the intent and follow-up questions in one object."""
+    questions = [line.split(". ", 1)[1] for line in LONG_ANSWER.splitlines()]
+    text = json.dumps({"intent": "Recommendation", "questions": questions}, ensure_ascii=False)
+    if app.state.rng.random() < app.state.config["malformed_rate"]:
+        app.state.stats["malformed"] += 1
+        return text[:len(text) // 2]
+    return text
+
+
+def rate_limited(config):
+    app.state.stats["rate_limited"] += 1
+    return JSONResponse(
+        status_code=429,
+        headers={"retry-after": str(config["retry_after"])},
+        content={"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+    )
+
+
+def injected_failure():
+    """Returns an error response for the configured error / rate-limit rates, else None."""
+    config, rng = app.state.config, app.state.rng
+    roll = rng.random()
+    if roll < config["rate_limit_rate"]:
+        return rate_limited(config)
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        app.state.stats["errors"] += 1
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": "Internal error (mock)", "type": "server_error", "code": None}},
+        )
+    return None
+
+
+def response_body(model, text, prompt=""):
+    input_tokens = len(str(prompt).split())
+    output_tokens = len(text.split())
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "output": [{
+            "type": "message",
+            "id": f"msg_{uuid.uuid4().hex}",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+def sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def first_token_ms():
+    """Latency before the first token, including the occasional straggler."""
+    config = app.state.config
+    ms = sample_ms(config["latency"])
+    if config["slow_rate"] and app.state.rng.random() < config["slow_rate"]:
+        app.state.stats["slow"] += 1
+        ms += config["slow_ms"]
+    return ms
+
+
+async def stream_events(body):
+    await asyncio.sleep(first_token_ms() / 1000.0)
+    item_id = body["output"][0]["id"]
+    text = body["output"][0]["content"][0]["text"]
+    yield sse({"type": "response.created", "sequence_number": 0, "response": dict(body, status="in_progress", output=[])})
+    words = text.split(" ")
+    for n, word in enumerate(words):
+        delta = word if n == len(words) - 1 else word + " "
+        yield sse({"type": "response.output_text.delta", "sequence_number": n + 1, "item_id": item_id,
+                   "output_index": 0, "content_index": 0, "delta": delta, "logprobs": []})
+        await asyncio.sleep(app.state.config["token_ms"] / 1000.0)
+    yield sse({"type": "response.completed", "sequence_number": len(words) + 1, "response": body})
+
+
+@app.post("/v1/responses")
+async def responses(request: Request):
+    body = await request.json()
+    app.state.stats["responses"] += 1
+    config = app.state.config
+    if config["max_concurrency"] and app.state.inflight >= config["max_concurrency"]:
+        return rate_limited(config)
+    failure = injected_failure()
+    if failure is not None:
+        return failure
+    model = body.get("model", "gpt-4o-mini")
+    prompt = body.get("input", "")
+    structured = ((body.get("text") or {}).get("format") or {}).get("type") == "json_schema"
+    result = response_body(model, structured_answer(prompt) if structured else answer_for(prompt), prompt)
+    if body.get("stream"):
+        return StreamingResponse(stream_events(result), media_type="text/event-stream")
+    app.state.inflight += 1
+    app.state.stats["peak_inflight"] = max(app.state.stats["peak_inflight"], app.state.inflight)
+    try:
+        # Generation time grows with output length like a real model
+        output_tokens = result["usage"]["output_tokens"]
+        await asyncio.sleep((first_token_ms() + output_tokens * config["token_ms"]) / 1000.0)
+    finally:
+        app.state.inflight -= 1
+    return result
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    app.state.stats["embeddings"] += 1
+    failure = injected_failure()
+    if failure is not None:
+        return failure
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    app.state.stats["embedded_texts"] += len(inputs)
+    dim = int(body.get("dimensions") or 3072)
+    await asyncio.sleep(sample_ms(app.state.config["embed_latency"]) / 1000.0)
+    data = []
+    for i, text in enumerate(inputs):
+        vector = hashingEmbedding(str(text), dim)
+        if body.get("encoding_format") == "base64":
+            embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+        else:
+            embedding = vector.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+    tokens = sum(len(str(t).split()) for t in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "text-embedding-3-large"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+@app.post("/mock/config")
+async def configure(request: Request):
+    updates = await request.json()
+    app.state.config.update(updates)
+    if updates.get("seed") is not None:
+        app.state.rng.seed(updates["seed"])
+    return app.state.config
+
+
+@app.get("/mock/stats")
+async def stats():
+    return dict(app.state.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default=None, help="LLM latency distribution, e.g. lognormal:200:0.5")
+    parser.add_argument("--latency-ms", type=float, default=None, help="shorthand for --latency fixed:<ms>")
+    parser.add_argument("--embed-latency", default="fixed:50")
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--max-concurrency", type=int, default=0, help="429 above this many in-flight LLM requests (0 = unlimited)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of LLM requests that straggle")
+    parser.add_argument("--slow-ms", type=float, default=0.0, help="extra latency of a straggler")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of structured answers that are not valid JSON")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    latency = args.latency or f"fixed:{args.latency_ms if args.latency_ms is not None else 200}"
+    app.state.config.update({
+        "latency": latency,
+        "embed_latency": args.embed_latency,
+        "token_ms": args.token_ms,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "retry_after": args.retry_after,
+        "max_concurrency": args.max_concurrency,
+        "slow_rate": args.slow_rate,
+        "slow_ms": args.slow_ms,
+        "malformed_rate": args.malformed_rate,
+        "seed": args.seed,
+    })
+    if args.seed is not None:
+        app.state.rng.seed(args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+In-memory BM25 index over the catalog documents and hybrid catalog search.
+
+Bare keyword queries ("serums", "face-wash", "SPF") match the ``Category:`` and
+``Tags:`` text ``catalogDB.py`` writes into every document, so they can be
+answered lexically without embedding the query. ``HybridCatalog`` wraps the
+catalog collection (or a ``CatalogIndex``) and:
+
+- answers short queries whose terms all occur in the catalog from BM25 alone;
+- for anything longer, fuses the vector and BM25 rankings with reciprocal
+  rank fusion (RRF).
+
+It mimics the ``query`` subset ``utils.searchProducts`` uses, like
+``vector_index.CatalogIndex``. It is opt-in (CATALOG_HYBRID=1): fused
+results differ from pure vector search and carry rank-based distances.
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+import metrics
+from vector_index import baseCollection, matchesWhere
+
+HYBRID_KEYWORD_TERMS = int(os.getenv("HYBRID_KEYWORD_TERMS", "3"))
+RRF_K = 60
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and any are as at be best buy for from get good i im in is it looking me my need of on or
+please product products recommend show some something that the to want with you your
+""".split())
+
+
+def stem(token):
+    """Folds simple English plurals so "serums" matches "serum"."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ses", "xes", "shes", "ches")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [stem(t) for t in _TOKEN.findall(str(text).lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents."""
+
+    def __init__(self, ids, documents, metadatas=None, k1=1.5, b=0.75):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas) if metadatas is not None else [{} for _ in self.ids]
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        lengths = []
+        for row, document in enumerate(self.documents):
+            counts = Counter(tokenize(document))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((row, tf))
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        n = len(self.documents)
+        self.idf = {
+            term: math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            for term, rows in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def covers(self, terms):
+        return bool(terms) and all(term in self.postings for term in terms)
+
+    def search(self, query, k=10, where=None):
+        """Returns up to ``k`` ``(row, score)`` pairs, best first."""
+        terms = query if isinstance(query, list) else tokenize(query)
+        scores = defaultdict(float)
+        for term in set(terms):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for row, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[row] / (self.avg_length or 1.0))
+                scores[row] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if where:
+            ranked = [(row, score) for row, score in ranked if matchesWhere(self.metadatas[row], where)]
+        return ranked[:k]
+
+
+def reciprocalRankFusion(rankings, k=RRF_K, weights=None):
+    """Fuses ranked id lists into ``[(id, score), ...]``, best first; ``weights`` scales each list."""
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, item in enumerate(ranking):
+            scores[item] += weight / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def _pseudoDistances(scores):
+    # rerankProducts expects l2 distances (similarity = 1 - d / 2) and only
+    # uses them relative to each other, so map the best score to 0.
+    top = scores[0] if scores and scores[0] > 0 else 1.0
+    return [1.0 - score / top for score in scores]
+
+
+class HybridCatalog:
+    """
+    Catalog search that skips the embedding call for keyword queries and
+    fuses BM25 with vector results otherwise. Call ``refresh()`` after
+    catalog ingestion; over an engine with ``checkVersion`` (the
+    memory-mapped index) the BM25 index is rebuilt when its version changes.
+    """
+
+    def __init__(self, collection, keyword_terms=HYBRID_KEYWORD_TERMS):
+        self.collection = collection
+        self.keyword_terms = keyword_terms
+        self._lock = threading.Lock()
+        self._rebuilding = threading.Lock()
+        self.index = None
+        self.version = None
+        self.refresh()
+
+    def _build(self, version):
+        data = baseCollection(self.collection).get(include=["documents", "metadatas"])
+        index = BM25Index(data["ids"], data["documents"], data["metadatas"])
+        with self._lock:
+            self.index, self.version = index, version
+        return index
+
+    def refresh(self):
+        if hasattr(self.collection, "refresh"):
+            self.collection.refresh()
+        return self._build(self.collection.checkVersion() if hasattr(self.collection, "checkVersion") else None)
+
+    def checkVersion(self):
+        """Version of the wrapped engine, rebuilding the BM25 index first if it changed."""
+        if not hasattr(self.collection, "checkVersion"):
+            return None
+        version = self.collection.checkVersion()
+        if version != self.version:
+            with self._rebuilding:
+                if version != self.version:
+                    self._build(version)
+        return version
+
+    def count(self):
+        return self.collection.count()
+
+    def isKeywordQuery(self, text):
+        terms = tokenize(text)
+        return 0 < len(terms) <= self.keyword_terms and self.index.covers(terms)
+
+    def query(self, query_texts, n_results=10, where=None, **kwargs):
+        """
+        Chroma-shaped results. Distances are derived from the BM25 or fused
+        score (best hit at 0) since lexical hits have no vector distance.
+        """
+        self.checkVersion()
+        index = self.index
+        query_texts = list(query_texts)
+        semantic = [i for i, text in enumerate(query_texts) if not self.isKeywordQuery(text)]
+
+        # Only the non-keyword queries are embedded, in one call
+        vector = {}
+        if semantic:
+            data = self.collection.query(query_texts=[query_texts[i] for i in semantic],
+                                         n_results=n_results, where=where, **kwargs)
+            for n, i in enumerate(semantic):
+                vector[i] = list(zip(data["ids"][n], data["metadatas"][n], data["documents"][n]))
+
+        result = {"ids": [], "distances": [], "metadatas": [], "documents": []}
+        with metrics.span("bm25"):
+            for i, text in enumerate(query_texts):
+                hits = index.search(text, n_results, where)
+                rows = {index.ids[row]: (index.metadatas[row], index.documents[row]) for row, _ in hits}
+                if i in vector:
+                    rows.update((id_, (meta, doc)) for id_, meta, doc in vector[i])
+                    ranked = reciprocalRankFusion([[id_ for id_, _, _ in vector[i]],
+                                                   [index.ids[row] for row, _ in hits]])[:n_results]
+                else:
+                    ranked = [(index.ids[row], score) for row, score in hits]
+                ids = [id_ for id_, _ in ranked]
+                result["ids"].append(ids)
+                result["distances"].append(_pseudoDistances([score for _, score in ranked]))
+                result["metadatas"].append([rows[id_][0] for id_ in ids])
+                result["documents"].append([rows[id_][1] for id_ in ids])
+        return result
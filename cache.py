@@ -0,0 +1,181 @@
+"""
+Two-tier TTL cache: an in-memory LRU in front of an optional SQLite store.
+
+Used by ``utils`` to memoize deterministic (temperature 0) LLM responses and
+reusable by anything else that maps a string key to a JSON-serializable value.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalizeText(text):
+    """Lowercases and collapses whitespace so trivially different inputs share a key."""
+    return " ".join(str(text).split()).lower()
+
+
+def collapseWhitespace(text):
+    """Collapses runs of whitespace and trims, keeping case."""
+    return " ".join(str(text).split())
+
+
+def cacheKey(*parts):
+    """Stable hex digest of the given key parts."""
+    payload = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+
+    def __init__(self):
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class TTLCache:
+    """
+    LRU + TTL cache with an optional on-disk SQLite tier.
+
+    - ``max_memory`` bounds the number of entries kept in process memory.
+    - ``max_disk`` bounds the number of rows in SQLite; the least recently
+      used rows are dropped first.
+    - ``ttl`` (seconds) applies to both tiers; ``None`` keeps entries forever.
+    - ``path=None`` disables the disk tier.
+    """
+
+    def __init__(self, path=None, ttl=None, max_memory=1024, max_disk=100_000):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.stats = CacheStats()
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, namespace TEXT, value TEXT,"
+                " created_at REAL, accessed_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+            self._db.commit()
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _remember(self, key, namespace, value, created_at):
+        self._memory[key] = (namespace, value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+            self.stats.evictions += 1
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[2], now):
+                    self._memory.move_to_end(key)
+                    self.stats.memory_hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT namespace, value, created_at FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    namespace, value, created_at = row
+                    if not self._expired(created_at, now):
+                        self._db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        value = json.loads(value)
+                        self._remember(key, namespace, value, created_at)
+                        self.stats.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.stats.misses += 1
+            return default
+
+    def set(self, key, value, namespace=""):
+        now = time.time()
+        with self._lock:
+            self._remember(key, namespace, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (key, namespace, value, created_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, namespace, json.dumps(value), now, now),
+                )
+                self._trim_disk(now)
+                self._db.commit()
+
+    def _trim_disk(self, now):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()
+        overflow = count - self.max_disk
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN"
+                " (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            )
+            self.stats.evictions += overflow
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._db.commit()
+
+    def invalidate(self, namespace=None):
+        """Drops every entry, or only those stored under ``namespace``."""
+        with self._lock:
+            if namespace is None:
+                self._memory.clear()
+            else:
+                for key in [k for k, v in self._memory.items() if v[0] == namespace]:
+                    del self._memory[key]
+            if self._db is not None:
+                if namespace is None:
+                    self._db.execute("DELETE FROM cache")
+                else:
+                    self._db.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+                self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            if self._db is not None:
+                return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            return len(self._memory)
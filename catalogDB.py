@@ -1,44 +1,102 @@
+import argparse
+import os
+
 import chromadb
-import chromadb.utils.embedding_functions as embedding_functions
 import pandas as pd
+from dotenv import load_dotenv
+
+from embeddings import makeEmbeddingFunction
+from ingest import addIndexArguments, formatReport, indexFromArguments, openCollection, syncRecords
+from mapped_index import exportIndex
+from precomputed import catalogFingerprint, writeCatalogVersion
+
+load_dotenv()
+
+CATALOG_PATH = "catalog"
+COLLECTION_NAME = "catalogs"
+DEFAULT_FILE = "Data/skincare catalog.xlsx"
+
+
+def loadCatalog(file_path):
+    """
+    Reads the first sheet of the catalog spreadsheet (or a CSV export).
+    """
+    if file_path.lower().endswith(".csv"):
+        df = pd.read_csv(file_path)
+    else:
+        df = pd.read_excel(file_path, sheet_name=0)
+
+    text_columns = ["product_id", "name", "category", "description", "top_ingredients", "tags"]
+    df[text_columns] = df[text_columns].fillna("").astype(str)
+
+    # Duplicate ids used to make collection.add fail outright; the last row wins.
+    duplicated = df["product_id"].duplicated(keep="last")
+    if duplicated.any():
+        print(f"Skipping {int(duplicated.sum())} duplicate product_id row(s): "
+              f"{sorted(set(df.loc[duplicated, 'product_id']))}")
+        df = df[~duplicated]
+    return df.reset_index(drop=True)
+
+
+def buildRecords(df):
+    """
+    Builds document strings and metadata for every row, column-wise.
+    """
+    documents = (
+        df["name"] + ". Category: " + df["category"] + ". Description: " + df["description"]
+        + ". Top Ingredients: " + df["top_ingredients"] + ". Tags: " + df["tags"] + "."
+    )
+
+    metadata_frame = pd.DataFrame({
+        "price": df["price (USD)"],
+        "margin": df["margin (%)"],
+        "Name": df["name"],
+        "category": df["category"],
+    })
+
+    return list(df["product_id"]), list(documents), metadata_frame.to_dict("records")
+
+
+def syncCatalog(collection, df, embedding_function, batch_size=64, workers=4):
+    """
+    Embeds and upserts new or changed products and deletes removed ones.
+    Rows where only price, margin or name changed get a metadata update.
+    """
+    ids, documents, metadatas = buildRecords(df)
+    return syncRecords(collection, ids, documents, metadatas, embedding_function,
+                       batch_size=batch_size, workers=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally sync the product catalog into Chroma.")
+    parser.add_argument("--file", default=DEFAULT_FILE, help="catalog spreadsheet (.xlsx) or CSV export")
+    parser.add_argument("--path", default=CATALOG_PATH, help="Chroma persistence directory")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--export", default=os.getenv("CATALOG_INDEX_PATH"),
+                        help="also write a memory-mapped index here for CATALOG_ENGINE=mmap workers")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recreate the collection if its dimensions or HNSW build settings changed")
+    addIndexArguments(parser)
+    args = parser.parse_args()
+
+    chroma_client = chromadb.PersistentClient(path=args.path)
+    openai_ef = makeEmbeddingFunction()
+    collection = openCollection(chroma_client, COLLECTION_NAME, openai_ef, rebuild=args.rebuild,
+                                index=indexFromArguments(args))
+
+    df = loadCatalog(args.file)
+    report = syncCatalog(collection, df, openai_ef, batch_size=args.batch_size, workers=args.workers)
+    if args.export:
+        version = exportIndex(collection, args.export,
+                              dimensions=int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None,
+                              quantization=os.getenv("CATALOG_QUANTIZATION", "float32"))
+        print(f"Exported index version {version}")
+    # Running apps compare this against their precomputed results and rebuild them
+    writeCatalogVersion(args.path, catalogFingerprint(collection))
+
+    print(formatReport(report))
 
-chroma_client = chromadb.PersistentClient(path="catalog")
-
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-                #api_key="YOUR_API_KEY",
-                model_name="text-embedding-3-large"
-            )
-collection = chroma_client.get_collection(name="catalogs", embedding_function=openai_ef)
-file_path = "/content/skincare catalog.xlsx"
-xls = pd.ExcelFile(file_path)
-sheet_names = xls.sheet_names
-df = xls.parse(sheet_names[0])
-
-# Prepare the data for Chroma collection
-documents = []
-metadatas = []
-ids = []
-
-for _, row in df.iterrows():
-    # Create the document by concatenating relevant columns
-    document = f"{row['name']}. Category: {row['category']}. Description: {row['description']}. " \
-               f"Top Ingredients: {row['top_ingredients']}. Tags: {row['tags']}."
-    
-    # Create metadata
-    metadata = {
-        "price": row["price (USD)"],
-        "margin": row["margin (%)"],
-        "Name": row['name']
-    }
-    
-    # Append to lists
-    documents.append(document)
-    metadatas.append(metadata)
-    ids.append(row["product_id"])
-
-collection.add(
-    documents=documents,
-    metadatas=metadatas,
-    ids=ids
-)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+Versioned catalog stores that are rebuilt on the side and swapped in live.
+
+``catalogDB.py`` syncs into the Chroma directory the app is reading. The
+sync service here instead watches the catalog spreadsheet (or a drop
+directory, using its newest .xlsx/.csv) and, when it changes, builds a new
+version next to the live one:
+
+    <root>/<version>/             Chroma store with the ``catalogs`` collection
+    <root>/<version>/sync.json    source file, its mtime, the row diff and timings
+    <root>/CURRENT                name of the live version
+
+Rows are diffed against the live version by ``product_id``. Unchanged rows
+are copied with their stored embeddings, so only added and edited products
+are embedded. The new store gets its fingerprint (``catalog_version``) and
+is published by replacing ``CURRENT`` atomically; old versions are pruned
+unless a reader still holds them open.
+
+Readers use ``LiveCatalog``. It stats ``CURRENT`` on each query, opens and
+warms the new version on a background thread (a fresh precomputed table
+included), then swaps its engine reference. Queries already running finish
+on the engine they started with; the retired version's Chroma client is
+closed once the last of them returns. The staleness window, from the source file
+changing to the swap, is logged and recorded in
+skincare_catalog_staleness_seconds.
+
+    python catalog_sync.py --watch "Data/skincare catalog.xlsx"
+    python catalog_sync.py --watch drop/ --export catalog_index
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import metrics
+from mapped_index import KEEP_VERSIONS, CURRENT_FILE, holdVersion, pruneVersions, readCurrent, writeCurrent
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "sync.json"
+SOURCE_SUFFIXES = (".xlsx", ".csv")
+
+
+def readManifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def closeClient(client):
+    """Releases a Chroma client's files and memory; ``client`` may be None."""
+    if client is not None:
+        client.close()
+
+
+def sourceFile(path):
+    """The spreadsheet to sync: ``path`` itself, or the newest catalog file in a drop directory."""
+    if not os.path.isdir(path):
+        return path if os.path.exists(path) else None
+    candidates = [entry.path for entry in os.scandir(path)
+                  if entry.is_file() and entry.name.lower().endswith(SOURCE_SUFFIXES)
+                  and not entry.name.startswith((".", "~$"))]
+    return max(candidates, key=os.path.getmtime, default=None)
+
+
+def sourceSignature(path):
+    """``(file, mtime, size)`` of the current source, or None."""
+    source = sourceFile(path)
+    if source is None:
+        return None
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return None
+    return source, stat.st_mtime, stat.st_size
+
+
+def diffRows(previous, ids, metadatas):
+    """
+    Compares new rows (``metadatas`` carrying ``content_hash``) with the
+    previous version's ``id -> metadata`` by product id.
+    """
+    current = set(ids)
+    diff = {"added": [], "changed": [], "metadata_updated": [], "unchanged": [],
+            "removed": sorted(set(previous) - current)}
+    for record_id, meta in zip(ids, metadatas):
+        old = previous.get(record_id)
+        if old is None:
+            diff["added"].append(record_id)
+        elif old.get("content_hash") != meta["content_hash"]:
+            diff["changed"].append(record_id)
+        elif old != meta:
+            diff["metadata_updated"].append(record_id)
+        else:
+            diff["unchanged"].append(record_id)
+    return diff
+
+
+def _previousCollection(root, seed_path, embedding_function):
+    import chromadb
+    from catalogDB import COLLECTION_NAME
+    from ingest import storedDimensions
+
+    version = readCurrent(root)
+    path = os.path.join(root, version) if version else seed_path
+    if not path or not os.path.exists(os.path.join(path, "chroma.sqlite3")):
+        return None, None
+    client = chromadb.PersistentClient(path=path)
+    try:
+        collection = client.get_collection(COLLECTION_NAME, embedding_function=embedding_function)
+    except Exception:
+        closeClient(client)
+        return None, None
+    # Embeddings of another size cannot be reused; everything is embedded again
+    expected = (embedding_function.get_config() or {}).get("dimensions")
+    stored = storedDimensions(collection)
+    if expected and stored and stored != expected:
+        closeClient(client)
+        return None, None
+    return client, collection
+
+
+def syncVersion(root, source, embedding_function, seed_path=None, export=None, index=None,
+                keep=KEEP_VERSIONS, detected_at=None, batch_size=64, workers=4):
+    """
+    Builds a new version of the catalog in ``source`` under ``root`` and makes
+    it current. Returns a report dict; ``version`` is None when no row changed.
+
+    The first version reuses embeddings from ``seed_path`` (the single-store
+    catalog directory) when it holds a compatible collection. With ``export``
+    a memory-mapped index is written there too (see ``mapped_index``).
+    """
+    import chromadb
+    from catalogDB import COLLECTION_NAME, buildRecords, loadCatalog
+    from ingest import contentHash, existingMetadata, openCollection, syncRecords
+    from mapped_index import exportIndex
+    from precomputed import catalogFingerprint, writeCatalogVersion
+
+    started = time.time()
+    detected_at = detected_at or started
+    source_mtime = os.path.getmtime(source)
+    ids, documents, metadatas = buildRecords(loadCatalog(source))
+    for doc, meta in zip(documents, metadatas):
+        meta["content_hash"] = contentHash(doc)
+
+    previous_client, previous = _previousCollection(root, seed_path, embedding_function)
+    try:
+        previous_meta = existingMetadata(previous) if previous is not None else {}
+        diff = diffRows(previous_meta, ids, metadatas)
+        report = {name: len(rows) for name, rows in diff.items()}
+        report.update(source=source, source_mtime=source_mtime, detected_at=detected_at, version=None)
+        if readCurrent(root) and not (diff["added"] or diff["changed"] or diff["metadata_updated"] or diff["removed"]):
+            report["sync_seconds"] = time.time() - started
+            return report
+
+        os.makedirs(root, exist_ok=True)
+        # Versions sort by creation time; readers only ever open the one named in CURRENT
+        version = f"{int(started * 1000)}"
+        path = os.path.join(root, version)
+        client = chromadb.PersistentClient(path=path)
+        try:
+            collection = openCollection(client, COLLECTION_NAME, embedding_function, index=index)
+            reused = diff["unchanged"] + diff["metadata_updated"]
+            position = {record_id: n for n, record_id in enumerate(ids)}
+            for start in range(0, len(reused), 500):
+                batch = reused[start:start + 500]
+                stored = previous.get(ids=batch, include=["embeddings"])
+                collection.add(
+                    ids=list(stored["ids"]),
+                    embeddings=stored["embeddings"],
+                    documents=[documents[position[record_id]] for record_id in stored["ids"]],
+                    metadatas=[metadatas[position[record_id]] for record_id in stored["ids"]]
+                )
+            # Only added and edited products reach the embedding API
+            synced = syncRecords(collection, ids, documents, metadatas, embedding_function,
+                                 batch_size=batch_size, workers=workers, prune=False)
+            report["embedded"] = synced["upserted"]
+
+            if export:
+                report["export"] = exportIndex(collection, export,
+                                               dimensions=int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None,
+                                               quantization=os.getenv("CATALOG_QUANTIZATION", "float32"))
+            writeCatalogVersion(path, catalogFingerprint(collection))
+        finally:
+            closeClient(client)
+    finally:
+        # Every client is closed before old version directories are pruned
+        closeClient(previous_client)
+    report["sync_seconds"] = time.time() - started
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(dict(report, version=version), f)
+
+    writeCurrent(root, version)
+    report["version"] = version
+    report["published_at"] = time.time()
+    report["staleness_seconds"] = report["published_at"] - source_mtime
+    pruneVersions(root, keep)
+    return report
+
+
+def formatSyncReport(report):
+    if report["version"] is None:
+        return f"{os.path.basename(report['source'])}: no changes ({report['sync_seconds']:.2f}s)"
+    return (f"{os.path.basename(report['source'])} -> version {report['version']}: "
+            f"{report['added']} added, {report['changed']} changed, {report['metadata_updated']} metadata-only, "
+            f"{report['removed']} removed, {report['unchanged']} unchanged; {report['embedded']} embedded; "
+            f"synced in {report['sync_seconds']:.2f}s, published {report['staleness_seconds']:.2f}s "
+            f"after the source changed")
+
+
+def watch(path, root, embedding_function, interval=2.0, **options):
+    """
+    Polls ``path`` every ``interval`` seconds and syncs once a changed source
+    has kept the same mtime and size for one poll (so half-written files are
+    not read). Runs until interrupted.
+    """
+    synced = readManifest(os.path.join(root, readCurrent(root) or ""))
+    last_synced = (synced.get("source"), synced.get("source_mtime"))
+    pending = None
+    logger.info("Watching %s every %.1fs", path, interval)
+    while True:
+        signature = sourceSignature(path)
+        if signature is not None and signature[:2] != last_synced:
+            if signature == pending:
+                try:
+                    report = syncVersion(root, signature[0], embedding_function, detected_at=detected, **options)
+                    logger.info(formatSyncReport(report))
+                    last_synced = signature[:2]
+                except Exception:
+                    logger.exception("Catalog sync of %s failed; retrying on the next change", signature[0])
+                    last_synced = signature[:2]
+                pending = None
+            else:
+                pending, detected = signature, time.time()
+        time.sleep(interval)
+
+
+class _Version:
+
+    def __init__(self, name, engine, close, release):
+        self.name = name
+        self.engine = engine
+        self.close = close
+        self.release = release
+        self.active = 0
+        self.retired = False
+
+
+class LiveCatalog:
+    """
+    Catalog engine for the current version under ``root``.
+
+    ``open_engine(path)`` returns ``(engine, close)`` for one version
+    directory: a ready engine (normally ``vector_index.catalogEngine`` over its
+    Chroma collection) and a callable that releases it, or None. A new
+    version is opened on a background thread while the old one keeps serving;
+    swapping is a single reference assignment. The old version is closed when
+    the last query still running on it returns. Each open version is held
+    under ``root`` (see ``mapped_index.holdVersion``) so the sync process does
+    not prune it from under this reader.
+    """
+
+    def __init__(self, root, open_engine):
+        self.root = root
+        self._open = open_engine
+        self._lock = threading.Lock()
+        self._loading = None
+        self._mtime = self._currentMtime()
+        version = readCurrent(root)
+        if version is None:
+            raise FileNotFoundError(f"No catalog version under {root!r}; run catalog_sync.py")
+        self._current = self._openVersion(version)
+
+    @property
+    def version(self):
+        return self._current.name
+
+    @property
+    def engine(self):
+        return self._current.engine
+
+    @property
+    def collection(self):
+        return self.engine
+
+    def _currentMtime(self):
+        try:
+            return os.stat(os.path.join(self.root, CURRENT_FILE)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _checkVersion(self):
+        mtime = self._currentMtime()
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime or (self._loading is not None and self._loading.is_alive()):
+                return
+            self._mtime = mtime
+            version = readCurrent(self.root)
+            if version is None or version == self.version:
+                return
+            self._loading = threading.Thread(target=self._swap, args=(version,), name="catalog-swap", daemon=True)
+            self._loading.start()
+
+    def _openVersion(self, version):
+        release = holdVersion(self.root, version)
+        try:
+            return _Version(version, *self._open(os.path.join(self.root, version)), release)
+        except BaseException:
+            release()
+            raise
+
+    def _close(self, version):
+        try:
+            if version.close is not None:
+                version.close()
+        except Exception:
+            logger.exception("Could not close catalog version %s", version.name)
+        finally:
+            version.release()
+
+    def _swap(self, version):
+        path = os.path.join(self.root, version)
+        try:
+            loaded = self._openVersion(version)
+        except Exception:
+            metrics.CATALOG_SWAPS.inc(1, "failed")
+            logger.exception("Could not open catalog version %s; still serving %s", version, self.version)
+            with self._lock:
+                # The next query retries instead of waiting for CURRENT to change again
+                self._mtime = None
+            return
+        with self._lock:
+            old, self._current = self._current, loaded
+            old.retired = True
+            idle = old.active == 0
+        if idle:
+            self._close(old)
+        metrics.CATALOG_SWAPS.inc(1, "swapped")
+        manifest = readManifest(path)
+        if manifest.get("source_mtime"):
+            staleness = time.time() - manifest["source_mtime"]
+            metrics.CATALOG_STALENESS_SECONDS.observe(staleness)
+            logger.info("Serving catalog version %s (synced in %.2fs, %.2fs after the source changed)",
+                        version, manifest.get("sync_seconds", 0.0), staleness)
+
+    def _call(self, method, *args, **kwargs):
+        with self._lock:
+            current = self._current
+            current.active += 1
+        try:
+            return getattr(current.engine, method)(*args, **kwargs)
+        finally:
+            with self._lock:
+                current.active -= 1
+                idle = current.retired and current.active == 0
+            if idle:
+                self._close(current)
+
+    def wait(self, timeout=None):
+        """Blocks until a version being opened in the background is swapped in."""
+        loading = self._loading
+        if loading is not None:
+            loading.join(timeout)
+
+    def refresh(self):
+        self._checkVersion()
+        self.wait()
+        return self.engine
+
+    def count(self):
+        return self._call("count")
+
+    def get(self, *args, **kwargs):
+        return self._call("get", *args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        self._checkVersion()
+        return self._call("query", *args, **kwargs)
+
+
+def main():
+    from dotenv import load_dotenv
+    from embeddings import makeEmbeddingFunction
+    from ingest import addIndexArguments, indexFromArguments
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Build catalog versions on the side and publish them atomically.")
+    parser.add_argument("--watch", default="Data/skincare catalog.xlsx",
+                        help="catalog spreadsheet (.xlsx/.csv) or a drop directory of them")
+    parser.add_argument("--root", default=os.getenv("CATALOG_VERSIONS_PATH", "catalog_versions"))
+    parser.add_argument("--seed", default=os.getenv("CATALOG_PATH", "catalog"),
+                        help="single-store catalog whose embeddings the first version reuses")
+    parser.add_argument("--export", default=os.getenv("CATALOG_INDEX_PATH"),
+                        help="also write a memory-mapped index here for CATALOG_ENGINE=mmap workers")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between polls")
+    parser.add_argument("--keep", type=int, default=KEEP_VERSIONS)
+    parser.add_argument("--once", action="store_true", help="sync once and exit instead of watching")
+    addIndexArguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    options = {"seed_path": args.seed, "export": args.export, "index": indexFromArguments(args), "keep": args.keep}
+    embedding_function = makeEmbeddingFunction()
+    if args.once:
+        source = sourceFile(args.watch)
+        if source is None:
+            parser.error(f"no catalog file at {args.watch}")
+        print(formatSyncReport(syncVersion(args.root, source, embedding_function, **options)))
+        return
+    try:
+        watch(args.watch, args.root, embedding_function, interval=args.interval, **options)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Token-budgeted context assembly for RAG prompts.
+
+``buildContext`` takes the retrieved documents, drops near-duplicates (the
+same review or ticket text indexed twice, overlapping chunks), orders what is
+left by relevance and fills a token budget. A document that is longer than
+the per-document cap is reduced to the sentences that share the most words
+with the question, falling back to plain truncation, so one long section
+cannot crowd out everything else.
+"""
+import os
+import re
+
+from cache import normalizeText
+from tokenizer import countTokens, truncateText
+
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+RAG_DOC_TOKENS = int(os.getenv("RAG_DOC_TOKENS", "400"))
+RAG_DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.85"))
+
+# Below this many tokens a squeezed-in document is not worth including
+MIN_DOC_TOKENS = 40
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def retrievedDocuments(results):
+    """
+    Flattens Chroma query results (``documents`` as a list of lists, with
+    optional ``distances``) or a plain list of strings into ``(text, distance)``
+    pairs in relevance order.
+    """
+    documents = results.get("documents") or []
+    distances = results.get("distances")
+    if documents and isinstance(documents[0], (list, tuple)):
+        documents = documents[0]
+        distances = distances[0] if distances else None
+    if not distances or len(distances) != len(documents):
+        distances = [None] * len(documents)
+    pairs = [(str(doc), dist) for doc, dist in zip(documents, distances) if doc and str(doc).strip()]
+    if all(dist is not None for _, dist in pairs):
+        pairs.sort(key=lambda pair: pair[1])
+    return pairs
+
+
+def _shingles(text, size=3):
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def dedupe(texts, threshold=RAG_DEDUP_THRESHOLD):
+    """
+    Keeps the first of any group of texts whose word-trigram overlap
+    (Jaccard) is at least ``threshold``. Returns the kept indices.
+    """
+    kept, seen_exact, kept_shingles = [], set(), []
+    for i, text in enumerate(texts):
+        exact = normalizeText(text)
+        if exact in seen_exact:
+            continue
+        shingles = _shingles(text)
+        duplicate = False
+        for other in kept_shingles:
+            union = len(shingles | other)
+            if union and len(shingles & other) / union >= threshold:
+                duplicate = True
+                break
+        if duplicate:
+            continue
+        seen_exact.add(exact)
+        kept_shingles.append(shingles)
+        kept.append(i)
+    return kept
+
+
+def condense(text, max_tokens, question=""):
+    """
+    Shrinks ``text`` to at most ``max_tokens`` tokens, keeping the sentences
+    most related to ``question`` in their original order.
+    """
+    if countTokens(text) <= max_tokens:
+        return text
+    sentences = [s.strip() for s in _SENTENCE.split(text) if s.strip()]
+    if len(sentences) > 1 and question:
+        wanted = set(_WORD.findall(question.lower()))
+        scored = sorted(
+            range(len(sentences)),
+            key=lambda i: (-len(wanted & set(_WORD.findall(sentences[i].lower()))), i)
+        )
+        chosen, used = [], 0
+        for i in scored:
+            cost = countTokens(sentences[i])
+            if used + cost > max_tokens:
+                continue
+            chosen.append(i)
+            used += cost
+        if chosen:
+            return "\n".join(sentences[i] for i in sorted(chosen))
+    return truncateText(text, max_tokens)
+
+
+def buildContext(results, question="", max_tokens=None, doc_tokens=None):
+    """
+    Returns ``(context_text, report)`` for the retrieved ``results``.
+
+    ``report`` counts the documents received, dropped as duplicates,
+    condensed and used, and the tokens before and after (``tokens_saved``).
+    """
+    max_tokens = RAG_CONTEXT_TOKENS if max_tokens is None else max_tokens
+    doc_tokens = RAG_DOC_TOKENS if doc_tokens is None else doc_tokens
+    pairs = retrievedDocuments(results)
+    texts = [text for text, _ in pairs]
+    tokens_before = sum(countTokens(text) for text in texts)
+
+    kept = dedupe(texts)
+    parts, used, condensed = [], 0, 0
+    for i in kept:
+        remaining = max_tokens - used
+        if remaining < MIN_DOC_TOKENS:
+            break
+        text = texts[i]
+        limit = min(doc_tokens, remaining)
+        if countTokens(text) > limit:
+            text = condense(text, limit, question)
+            condensed += 1
+        parts.append(text)
+        used += countTokens(text)
+
+    context = "\n\n".join(parts)
+    tokens_after = countTokens(context) if parts else 0
+    report = {
+        "documents": len(texts),
+        "duplicates": len(texts) - len(kept),
+        "condensed": condensed,
+        "used": len(parts),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": max(0, tokens_before - tokens_after),
+    }
+    return context, report
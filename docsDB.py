@@ -1,98 +1,120 @@
+import argparse
+
 import chromadb
-import chromadb.utils.embedding_functions as embedding_functions
-import pandas as pd
 from docx import Document
+from dotenv import load_dotenv
+
+from embeddings import makeEmbeddingFunction
+from ingest import addIndexArguments, formatReport, indexFromArguments, openCollection, syncRecords
+from tokenizer import chunkText, countTokens
+
+load_dotenv()
+
+DOCS_PATH = "docs"
+COLLECTION_NAME = "docs"
+DEFAULT_FILE = "Data/Additional info (brand, reviews, customer tickets).docx"
 
-chroma_client = chromadb.PersistentClient(path="docs")
-
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-                #api_key="YOUR_API_KEY",
-                model_name="text-embedding-3-large"
-            )
-collection = chroma_client.get_collection(name="docs", embedding_function=openai_ef)
-
-# Load the DOCX file
-file_path = "Additional info (brand, reviews, customer tickets).docx"
-doc = Document(file_path)
-
-# Extract brand philosophy text (all paragraphs until first table)
-paras = []
-for para in doc.paragraphs:
-    if para.text.strip() == "":
-        continue
-    paras.append(para.text)
-    # Stop if we detect start of tables in document flow; 
-    # but python-docx doesn't link paragraphs to tables directly. 
-    # Instead, we'll stop before tables by separate logic below.
-
-# Extract tables
-tables = doc.tables
-
-# Extract brand philosophy by taking paragraphs up to a keyword
-brand_philosophy = []
-for para in doc.paragraphs:
-    if para.text.strip().startswith("Reviewer"):
-        break
-    if para.text.strip():
-        brand_philosophy.append(para.text)
-
-brand_philosophy_text = "\n".join(brand_philosophy)
-
-# Process reviews table (first table)
-reviews = []
-review_metadata = []
-review_ids = []
-for i, row in enumerate(tables[0].rows):
-    if i == 0:
-        # header row
-        headers = [cell.text.strip() for cell in row.cells]
-    else:
+
+def tableRows(table):
+    """
+    Yields (row_index, {header: cell_text}) for every data row of a docx table.
+    """
+    headers = None
+    for i, row in enumerate(table.rows):
         cells = [cell.text.strip() for cell in row.cells]
-        data = dict(zip(headers, cells))
-        if len(data["Review"])==0:
-          continue
-        # Create document and metadata
-        doc_text = data["Review"] or ""
-        metadata = {
+        if i == 0:
+            headers = cells
+            continue
+        yield i, dict(zip(headers, cells))
+
+
+def chunkRecord(record_id, text, metadata, max_tokens, overlap):
+    """
+    Splits one logical record into overlapping chunks with stable ids.
+
+    A record that fits in one chunk keeps its plain id (e.g. ``review_3``);
+    longer ones become ``<id>#0``, ``<id>#1``, ... so re-runs upsert the same ids.
+    """
+    chunks = chunkText(text, max_tokens=max_tokens, overlap=overlap)
+    if len(chunks) == 1:
+        return [record_id], [text], [dict(metadata)]
+    ids, documents, metadatas = [], [], []
+    for n, chunk in enumerate(chunks):
+        ids.append(f"{record_id}#{n}")
+        documents.append(chunk)
+        metadatas.append(dict(metadata, parent_id=record_id, chunk=n, chunks=len(chunks)))
+    return ids, documents, metadatas
+
+
+def extractRecords(file_path, max_tokens=400, overlap=50):
+    """
+    Reads the brand philosophy, reviews and customer tickets from the docx file.
+    """
+    doc = Document(file_path)
+    tables = doc.tables
+
+    # Extract brand philosophy by taking paragraphs up to a keyword
+    brand_philosophy = []
+    for para in doc.paragraphs:
+        if para.text.strip().startswith("Reviewer"):
+            break
+        if para.text.strip():
+            brand_philosophy.append(para.text)
+
+    ids, documents, metadatas = [], [], []
+
+    def add(record_id, text, metadata):
+        chunk_ids, chunk_docs, chunk_metas = chunkRecord(record_id, text, metadata, max_tokens, overlap)
+        ids.extend(chunk_ids)
+        documents.extend(chunk_docs)
+        metadatas.extend(chunk_metas)
+
+    add("brand_philosophy", "\n".join(brand_philosophy), {"section": "Brand Philosophy"})
+
+    # Process reviews table (first table)
+    for i, data in tableRows(tables[0]):
+        if len(data["Review"]) == 0:
+            continue
+        add(f"review_{i}", data["Review"], {
             "Reviewer": data["Reviewer"] or "",
             "Product": data["Product"] or "",
             "Rating": data["Rating"] or ""
-        }
-        reviews.append(doc_text)
-        review_metadata.append(metadata)
-        review_ids.append(f"review_{i}")
-
-# Process customer tickets table (second table)
-tickets = []
-ticket_metadata = []
-ticket_ids = []
-for i, row in enumerate(tables[1].rows):
-    if i == 0:
-        headers = [cell.text.strip() for cell in row.cells]
-    else:
-        cells = [cell.text.strip() for cell in row.cells]
-        data = dict(zip(headers, cells))
+        })
+
+    # Process customer tickets table (second table)
+    for i, data in tableRows(tables[1]):
         doc_text = f"Customer Message: {data['Customer Message']}. Support Response: {data['Support Response']}"
-        metadata = {
-            "TicketID": data["Ticket ID"] or ""
-        }
-        tickets.append(doc_text)
-        ticket_metadata.append(metadata)
-        ticket_ids.append(data["Ticket ID"])
-
-# Prepare brand philosophy as separate entry
-bp_document = brand_philosophy_text
-bp_metadata = {"section": "Brand Philosophy"}
-bp_id = "brand_philosophy"
-
-# Combine all
-documents = [bp_document] + reviews + tickets
-metadatas = [bp_metadata] + review_metadata + ticket_metadata
-ids = [bp_id] + review_ids + ticket_ids
-
-for i in range(len(documents)):
-  collection.add(
-      documents=[documents[i]],
-      metadatas=[metadatas[i]],
-      ids=[ids[i]]
-  )
\ No newline at end of file
+        add(data["Ticket ID"] or f"ticket_{i}", doc_text, {"TicketID": data["Ticket ID"] or ""})
+
+    return ids, documents, metadatas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally sync brand docs, reviews and tickets into Chroma.")
+    parser.add_argument("--file", default=DEFAULT_FILE, help="source .docx file")
+    parser.add_argument("--path", default=DOCS_PATH, help="Chroma persistence directory")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recreate the collection if its dimensions or HNSW build settings changed")
+    parser.add_argument("--chunk-tokens", type=int, default=400)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    addIndexArguments(parser)
+    args = parser.parse_args()
+
+    chroma_client = chromadb.PersistentClient(path=args.path)
+    openai_ef = makeEmbeddingFunction()
+    collection = openCollection(chroma_client, COLLECTION_NAME, openai_ef, rebuild=args.rebuild,
+                                index=indexFromArguments(args))
+
+    ids, documents, metadatas = extractRecords(args.file, args.chunk_tokens, args.chunk_overlap)
+    report = syncRecords(collection, ids, documents, metadatas, openai_ef,
+                         batch_size=args.batch_size, workers=args.workers)
+
+    tokens = sum(countTokens(doc) for doc in documents)
+    print(formatReport(report))
+    print(f"{len(documents)} chunks, ~{tokens} tokens, {tokens / report['seconds']:.0f} tokens/s")
+
+
+if __name__ == "__main__":
+    main()
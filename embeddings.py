@@ -0,0 +1,247 @@
+"""
+Embedding helpers shared by the catalog and docs collections.
+
+``CachingEmbeddingFunction`` wraps any Chroma embedding function (normally the
+``OpenAIEmbeddingFunction`` for ``text-embedding-3-large``) so repeated texts
+are embedded once: vectors are keyed by a hash of the model config and text,
+kept in a bounded in-memory LRU and optionally persisted as float32 blobs in
+SQLite. Duplicate texts inside one call are sent upstream only once.
+
+EMBEDDING_DIMENSIONS asks the model for shorter vectors (text-embedding-3
+models keep most of their quality when shortened). Both stores must be
+re-ingested after changing it; see ``ingest.openCollection``.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import chromadb.utils.embedding_functions as embedding_functions
+from chromadb.api.types import Documents, EmbeddingFunction
+
+import metrics
+from singleflight import SingleFlight
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+
+
+class VectorStore:
+    """Persistent ``key -> float32 vector`` map in a single SQLite table."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO vectors (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+            )
+            self._db.commit()
+
+
+class CachingEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Drop-in wrapper for a Chroma embedding function that memoizes vectors.
+
+    It reports the wrapped function's ``name()`` and config so Chroma treats it
+    as the same embedding function the collection was created with.
+    """
+
+    def __init__(self, inner, max_entries=4096, path=None):
+        self.inner = inner
+        self.max_entries = max_entries
+        self.store = VectorStore(path) if path else None
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "deduplicated": 0, "coalesced": 0, "upstream_calls": 0}
+        self._flight = SingleFlight("embedding")
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        try:
+            config = inner.get_config()
+        except Exception:
+            config = None
+        self._namespace = json.dumps(config if isinstance(config, dict) else type(inner).__name__, sort_keys=True, default=str)
+
+    def key(self, text):
+        return hashlib.sha256(f"{self._namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def __call__(self, input: Documents):
+        keys = [self.key(text) for text in input]
+        vectors = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                if key in vectors:
+                    continue
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    vectors[key] = vector
+                    self.stats["hits"] += 1
+                else:
+                    vectors[key] = None
+                    missing.append(key)
+            self.stats["deduplicated"] += len(keys) - len(vectors)
+
+        if missing and self.store is not None:
+            stored = self.store.get_many(missing)
+            with self._lock:
+                for key, vector in stored.items():
+                    vectors[key] = vector
+                    self._remember(key, vector)
+                self.stats["disk_hits"] += len(stored)
+            missing = [key for key in missing if key not in stored]
+
+        if missing:
+            pending = set(missing)
+            texts = {}
+            for key, text in zip(keys, input):
+                if key in pending and key not in texts:
+                    texts[key] = text
+            # Texts another thread is already embedding are waited for, not re-sent
+            fetched = []
+
+            def embed(leader_keys):
+                with metrics.span("embedding"):
+                    result = self.inner([texts[key] for key in leader_keys])
+                result = [np.asarray(vector, dtype=np.float32) for vector in result]
+                fetched.extend(zip(leader_keys, result))
+                return result
+
+            fresh = self._flight.doMany(list(texts), embed)
+            with self._lock:
+                self.stats["misses"] += len(fetched)
+                self.stats["coalesced"] += len(fresh) - len(fetched)
+                self.stats["upstream_calls"] += 1 if fetched else 0
+                for key, vector in fresh.items():
+                    vectors[key] = vector
+                    self._remember(key, vector)
+            if self.store is not None and fetched:
+                self.store.put_many(fetched)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, input: Documents):
+        return self.__call__(input)
+
+    def name(self):
+        return self.inner.name()
+
+    def get_config(self):
+        return self.inner.get_config()
+
+    def default_space(self):
+        return self.inner.default_space()
+
+    def supported_spaces(self):
+        return self.inner.supported_spaces()
+
+    def is_legacy(self):
+        return self.inner.is_legacy()
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def hashingEmbedding(text, dim=3072):
+    """
+    Deterministic, offline stand-in for a text embedding.
+
+    Words, word bigrams and character trigrams are hashed into signed buckets
+    and the result is L2-normalized, so texts sharing vocabulary are close.
+    Used by the mock OpenAI server and the offline evaluation harnesses.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    tokens = _WORD.findall(text.lower())
+    features = [(t, 1.0) for t in tokens]
+    features += [(f"{a} {b}", 0.5) for a, b in zip(tokens, tokens[1:])]
+    features += [(f"#{t[i:i + 3]}", 0.25) for t in tokens for i in range(max(1, len(t) - 2))]
+    for feature, weight in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        vector[h % dim] += weight if (h >> 63) & 1 else -weight
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+    return vector / norm
+
+
+class HashingEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Chroma embedding function over ``hashingEmbedding``; needs no network."""
+
+    def __init__(self, dim=3072):
+        self.dim = dim
+
+    def __call__(self, input: Documents):
+        return [hashingEmbedding(text, self.dim) for text in input]
+
+    @staticmethod
+    def name():
+        return "hashing"
+
+    def get_config(self):
+        return {"dim": self.dim}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashingEmbeddingFunction(**config)
+
+
+_embedding_function = None
+_ef_lock = threading.Lock()
+
+
+def makeEmbeddingFunction():
+    """
+    Returns the process-wide caching OpenAI embedding function.
+
+    EMBEDDING_CACHE_SIZE bounds the in-memory LRU (default 4096 vectors) and
+    EMBEDDING_CACHE_PATH, when set, persists vectors to SQLite. Vectors have
+    EMBEDDING_DIMENSIONS dimensions (the model's full size when unset).
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        with _ef_lock:
+            if _embedding_function is None:
+                openai_ef = embedding_functions.OpenAIEmbeddingFunction(
+                    model_name=EMBEDDING_MODEL,
+                    api_key=os.environ["OPENAI_API_KEY"],
+                    dimensions=EMBEDDING_DIMENSIONS
+                )
+                _embedding_function = CachingEmbeddingFunction(
+                    openai_ef,
+                    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+                    path=os.getenv("EMBEDDING_CACHE_PATH") or None
+                )
+    return _embedding_function
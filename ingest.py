@@ -0,0 +1,176 @@
+"""
+Shared batched, incremental upsert used by catalogDB.py and docsDB.py.
+
+Every record carries a ``content_hash`` of its document text in its metadata.
+A sync embeds only records whose hash changed, updates metadata in place
+when only metadata changed, and (optionally) deletes ids that are no longer
+produced, so re-running an ingestion costs time proportional to the diff.
+
+Collections are created with the HNSW settings from ``indexConfiguration``
+(CHROMA_HNSW_SPACE, CHROMA_HNSW_M, CHROMA_HNSW_EF_CONSTRUCTION,
+CHROMA_HNSW_EF_SEARCH or the matching ``--hnsw-*`` flags).
+"""
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Settings fixed when the graph is built; ef_search can change afterwards
+_BUILD_SETTINGS = ("space", "max_neighbors", "ef_construction")
+
+
+def contentHash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def existingMetadata(collection):
+    """
+    Maps every id already in the collection to its stored metadata.
+    """
+    stored = collection.get(include=["metadatas"])
+    return {record_id: meta or {} for record_id, meta in zip(stored["ids"], stored["metadatas"])}
+
+
+def storedDimensions(collection):
+    """Length of the stored vectors, or None for an empty collection."""
+    data = collection.get(limit=1, include=["embeddings"])
+    return len(data["embeddings"][0]) if data["ids"] else None
+
+
+def indexConfiguration(space=None, m=None, ef_construction=None, ef_search=None):
+    """
+    Chroma collection configuration for the HNSW index, or None for Chroma's
+    defaults (l2, M=16, ef_construction=100, ef_search=100).
+
+    Arguments left unset fall back to CHROMA_HNSW_SPACE, CHROMA_HNSW_M,
+    CHROMA_HNSW_EF_CONSTRUCTION and CHROMA_HNSW_EF_SEARCH.
+    """
+    values = {
+        "space": space or os.getenv("CHROMA_HNSW_SPACE"),
+        "max_neighbors": m or os.getenv("CHROMA_HNSW_M"),
+        "ef_construction": ef_construction or os.getenv("CHROMA_HNSW_EF_CONSTRUCTION"),
+        "ef_search": ef_search or os.getenv("CHROMA_HNSW_EF_SEARCH"),
+    }
+    hnsw = {key: value if key == "space" else int(value) for key, value in values.items() if value}
+    return {"hnsw": hnsw} if hnsw else None
+
+
+def addIndexArguments(parser):
+    """Adds the ``--hnsw-*`` flags read by ``indexConfiguration`` to an ingestion CLI."""
+    parser.add_argument("--hnsw-space", choices=("l2", "cosine", "ip"), help="distance space (default l2)")
+    parser.add_argument("--hnsw-m", type=int, help="graph neighbors per node (default 16)")
+    parser.add_argument("--hnsw-ef-construction", type=int, help="candidate list while building (default 100)")
+    parser.add_argument("--hnsw-ef-search", type=int, help="candidate list while querying (default 100)")
+
+
+def indexFromArguments(args):
+    return indexConfiguration(args.hnsw_space, args.hnsw_m, args.hnsw_ef_construction, args.hnsw_ef_search)
+
+
+def _copyIndex(index):
+    return {key: dict(value) for key, value in index.items()} if index else None
+
+
+def indexSettings(collection):
+    """The stored HNSW settings of a collection, read without building its embedding function."""
+    return dict((collection.configuration_json or {}).get("hnsw") or {})
+
+
+def openCollection(client, name, embedding_function, rebuild=False, index=None):
+    """
+    ``get_or_create_collection`` that notices an EMBEDDING_DIMENSIONS or index change.
+
+    New collections are created with ``index`` (see ``indexConfiguration``).
+    An existing collection gets a new ef_search in place, which Chroma reads
+    when a process next loads the index. Vectors of another length cannot be
+    mixed into a collection, and the distance space, M and ef_construction
+    are fixed once the graph is built, so for those changes with ``rebuild``
+    it is dropped and created again (every record is re-embedded by the next
+    sync); otherwise a ValueError says so.
+    """
+    # Chroma fills its defaults into the configuration it is given, so it gets a copy
+    wanted = dict((index or {}).get("hnsw") or {})
+    collection = client.get_or_create_collection(name=name, embedding_function=embedding_function,
+                                                 configuration=_copyIndex(index))
+    problems = []
+    expected = (embedding_function.get_config() or {}).get("dimensions")
+    stored = storedDimensions(collection)
+    # Without EMBEDDING_DIMENSIONS the model's size is unknown here; Chroma rejects a mismatch on upsert
+    if expected and stored is not None and stored != expected:
+        problems.append(f"holds {stored}-dimensional vectors but the embedding profile asks for {expected}")
+    current = indexSettings(collection)
+    changed = [key for key in _BUILD_SETTINGS if key in wanted and current.get(key) != wanted[key]]
+    if changed:
+        problems.append("was built with " + ", ".join(f"{key}={current.get(key)}" for key in changed)
+                        + " but " + ", ".join(f"{key}={wanted[key]}" for key in changed) + " is asked for")
+    if not problems:
+        if "ef_search" in wanted and current.get("ef_search") != wanted["ef_search"]:
+            collection.modify(configuration={"hnsw": {"ef_search": wanted["ef_search"]}})
+        return collection
+    if not rebuild:
+        raise ValueError(f"Collection '{name}' {'; '.join(problems)}; re-run with --rebuild")
+    client.delete_collection(name)
+    return client.create_collection(name=name, embedding_function=embedding_function, configuration=_copyIndex(index))
+
+
+def syncRecords(collection, ids, documents, metadatas, embedding_function,
+                batch_size=64, workers=4, prune=True):
+    """
+    Upserts new or changed records and, with ``prune``, deletes ids not in ``ids``.
+
+    ``content_hash`` is added to each metadata dict. Embedding runs in
+    ``batch_size`` batches on up to ``workers`` threads; writes to Chroma
+    happen on the calling thread.
+    """
+    start = time.perf_counter()
+    hashes = [contentHash(doc) for doc in documents]
+    for meta, content_hash in zip(metadatas, hashes):
+        meta["content_hash"] = content_hash
+    current = existingMetadata(collection)
+
+    changed = [i for i, (record_id, content_hash) in enumerate(zip(ids, hashes))
+               if current.get(record_id, {}).get("content_hash") != content_hash]
+    changed_set = set(changed)
+    retagged = [i for i, record_id in enumerate(ids)
+                if i not in changed_set and current[record_id] != metadatas[i]]
+    removed = sorted(set(current) - set(ids)) if prune else []
+
+    batches = [changed[i:i + batch_size] for i in range(0, len(changed), batch_size)]
+
+    def embed(batch):
+        return batch, embedding_function([documents[i] for i in batch])
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for batch, vectors in pool.map(embed, batches):
+            collection.upsert(
+                ids=[ids[i] for i in batch],
+                documents=[documents[i] for i in batch],
+                metadatas=[metadatas[i] for i in batch],
+                embeddings=vectors
+            )
+
+    if retagged:
+        collection.update(ids=[ids[i] for i in retagged], metadatas=[metadatas[i] for i in retagged])
+
+    if removed:
+        collection.delete(ids=removed)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": len(ids),
+        "upserted": len(changed),
+        "metadata_updated": len(retagged),
+        "unchanged": len(ids) - len(changed) - len(retagged),
+        "deleted": len(removed),
+        "embedding_batches": len(batches),
+        "embeddings_saved": len(ids) - len(changed),
+        "seconds": elapsed,
+        "rows_per_second": len(ids) / elapsed if elapsed else 0.0,
+    }
+
+
+def formatReport(report):
+    return (f"{report['rows']} rows in {report['seconds']:.2f}s ({report['rows_per_second']:.1f} rows/s): "
+            f"{report['upserted']} upserted, {report['metadata_updated']} metadata-only, "
+            f"{report['unchanged']} unchanged, {report['deleted']} deleted; "
+            f"{report['embedding_batches']} embedding call(s), {report['embeddings_saved']} embeddings saved")
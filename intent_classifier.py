@@ -0,0 +1,242 @@
+"""
+Local fast-path intent classifier.
+
+A multinomial Naive Bayes model over word, bigram and shape features. It
+labels a query as "Recommendation" or "Non-Recommendation" in microseconds and
+reports a confidence, temperature-scaled on held-out examples so it tracks
+how often the label is right; ``utils.detectIntent`` only falls back to the
+LLM (``findIntent``) when that confidence is below the configured threshold.
+
+The model is trained from ``SEED_EXAMPLES`` plus any LLM-labeled traffic
+logged to ``INTENT_LOG_PATH`` (one ``{"query": ..., "intent": ...}`` JSON object
+per line), and can be saved to / loaded from a JSON file.
+"""
+import json
+import math
+import os
+import re
+from collections import Counter
+
+RECOMMENDATION = "Recommendation"
+NON_RECOMMENDATION = "Non-Recommendation"
+LABELS = (RECOMMENDATION, NON_RECOMMENDATION)
+
+SEED_EXAMPLES = [
+    ("serums", RECOMMENDATION),
+    ("moisturizers", RECOMMENDATION),
+    ("sunscreen", RECOMMENDATION),
+    ("sunscreen for oily skin", RECOMMENDATION),
+    ("something gentle for summer", RECOMMENDATION),
+    ("I want to buy face-wash", RECOMMENDATION),
+    ("face wash", RECOMMENDATION),
+    ("cleanser for sensitive skin", RECOMMENDATION),
+    ("toners", RECOMMENDATION),
+    ("spf", RECOMMENDATION),
+    ("night cream", RECOMMENDATION),
+    ("eye cream for dark circles", RECOMMENDATION),
+    ("recommend a serum for acne", RECOMMENDATION),
+    ("suggest a moisturizer for dry skin", RECOMMENDATION),
+    ("looking for a vitamin c serum", RECOMMENDATION),
+    ("need something for dry flaky skin", RECOMMENDATION),
+    ("best products for oily skin", RECOMMENDATION),
+    ("show me cleansers", RECOMMENDATION),
+    ("i need a lip balm", RECOMMENDATION),
+    ("anti aging cream", RECOMMENDATION),
+    ("fragrance free moisturizer", RECOMMENDATION),
+    ("something for acne-prone skin", RECOMMENDATION),
+    ("hydrating toner", RECOMMENDATION),
+    ("exfoliator", RECOMMENDATION),
+    ("face masks", RECOMMENDATION),
+    ("what should I buy for hyperpigmentation", RECOMMENDATION),
+    ("gift set for my mom", RECOMMENDATION),
+    ("lightweight gel moisturizer", RECOMMENDATION),
+    ("what should I use for oily skin", RECOMMENDATION),
+    ("which moisturizer should I get?", RECOMMENDATION),
+    ("what do you recommend for dark spots?", RECOMMENDATION),
+    ("can you suggest a toner for large pores", RECOMMENDATION),
+    ("How is this serum for sensitive skin?", NON_RECOMMENDATION),
+    ("What happened to my user ticket", NON_RECOMMENDATION),
+    ("What is the brand philosophy?", NON_RECOMMENDATION),
+    ("where is my order", NON_RECOMMENDATION),
+    ("my order has not arrived yet", NON_RECOMMENDATION),
+    ("can I return a product", NON_RECOMMENDATION),
+    ("what is your refund policy", NON_RECOMMENDATION),
+    ("is the dewdrop elixir safe during pregnancy?", NON_RECOMMENDATION),
+    ("what do reviewers say about the bha serum", NON_RECOMMENDATION),
+    ("does the brand test on animals", NON_RECOMMENDATION),
+    ("how do I use the night cream", NON_RECOMMENDATION),
+    ("my package arrived damaged", NON_RECOMMENDATION),
+    ("I got a rash after using the toner", NON_RECOMMENDATION),
+    ("how long does shipping take", NON_RECOMMENDATION),
+    ("what is the status of my ticket", NON_RECOMMENDATION),
+    ("are your products vegan?", NON_RECOMMENDATION),
+    ("how often should I apply sunscreen?", NON_RECOMMENDATION),
+    ("why was I charged twice", NON_RECOMMENDATION),
+    ("cancel my subscription", NON_RECOMMENDATION),
+    ("what are the ingredients in the radiant renewal serum", NON_RECOMMENDATION),
+    ("can I use vitamin c with retinol?", NON_RECOMMENDATION),
+    ("who founded the brand", NON_RECOMMENDATION),
+]
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+_QUESTION_WORDS = {"what", "how", "why", "where", "when", "who", "is", "are", "does", "do", "can", "did", "was"}
+
+
+def features(query):
+    """Bag of features used by the classifier."""
+    text = query.lower()
+    tokens = _TOKEN.findall(text)
+    feats = [f"w:{t}" for t in tokens]
+    feats += [f"b:{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    if tokens:
+        feats.append(f"first:{tokens[0]}")
+        if tokens[0] in _QUESTION_WORDS:
+            feats.append("shape:question-word")
+    if "?" in text:
+        feats.append("shape:question-mark")
+    feats.append("shape:short" if len(tokens) <= 3 else "shape:long")
+    return feats
+
+
+class IntentClassifier:
+
+    def __init__(self, alpha=0.5, temperature=1.0):
+        self.alpha = alpha
+        # Naive Bayes counts overlapping word, bigram and shape features as
+        # independent evidence, so raw posteriors are overconfident;
+        # ``calibrate`` fits this divisor of the log-odds.
+        self.temperature = temperature
+        self.label_counts = Counter()
+        self.feature_counts = {label: Counter() for label in LABELS}
+        self.feature_totals = Counter()
+        self.vocabulary = set()
+
+    def fit(self, examples):
+        for query, label in examples:
+            label = normalizeLabel(label)
+            if label is None:
+                continue
+            self.label_counts[label] += 1
+            for feat in features(query):
+                self.feature_counts[label][feat] += 1
+                self.feature_totals[label] += 1
+                self.vocabulary.add(feat)
+        return self
+
+    def _scores(self, query):
+        total = sum(self.label_counts.values())
+        feats = features(query)
+        vocab = len(self.vocabulary) + 1
+        scores = {}
+        for label in LABELS:
+            score = math.log((self.label_counts[label] + self.alpha) / (total + 2 * self.alpha))
+            denom = self.feature_totals[label] + self.alpha * vocab
+            counts = self.feature_counts[label]
+            for feat in feats:
+                if feat in self.vocabulary:
+                    score += math.log((counts[feat] + self.alpha) / denom)
+            scores[label] = score
+        return scores
+
+    def predict(self, query):
+        """Returns ``(label, confidence)`` where confidence is the calibrated posterior of ``label``."""
+        if not self.label_counts:
+            return RECOMMENDATION, 0.0
+        scores = self._scores(query)
+        best = max(scores, key=scores.get)
+        peak = scores[best]
+        norm = sum(math.exp((s - peak) / self.temperature) for s in scores.values())
+        return best, 1.0 / norm
+
+    def calibrate(self, examples, folds=5):
+        """
+        Temperature scaling: picks the temperature that minimizes the log loss
+        of out-of-fold predictions on ``examples``. Returns self.
+        """
+        examples = [(query, normalizeLabel(label)) for query, label in examples]
+        examples = [(query, label) for query, label in examples if label is not None]
+        folds = min(folds, len(examples))
+        margins = []
+        for fold in range(folds):
+            train = [ex for i, ex in enumerate(examples) if i % folds != fold]
+            model = IntentClassifier(alpha=self.alpha).fit(train)
+            if len(model.label_counts) < len(LABELS):
+                continue
+            for query, label in examples[fold::folds]:
+                scores = model._scores(query)
+                margins.append(scores[label] - max(s for other, s in scores.items() if other != label))
+        if not margins:
+            return self
+
+        def logLoss(temperature):
+            # log(1 + e^-x) without overflow for large negative margins
+            return sum(max(0.0, -m / temperature) + math.log1p(math.exp(-abs(m) / temperature)) for m in margins)
+
+        self.temperature = min((t / 20 for t in range(10, 401)), key=logLoss)
+        return self
+
+    def to_dict(self):
+        return {
+            "alpha": self.alpha,
+            "temperature": self.temperature,
+            "label_counts": dict(self.label_counts),
+            "feature_counts": {label: dict(c) for label, c in self.feature_counts.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls(alpha=data.get("alpha", 0.5), temperature=data.get("temperature", 1.0))
+        model.label_counts = Counter(data["label_counts"])
+        for label, counts in data["feature_counts"].items():
+            model.feature_counts[label] = Counter(counts)
+            model.feature_totals[label] = sum(counts.values())
+            model.vocabulary.update(counts)
+        return model
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def normalizeLabel(label):
+    """Maps raw LLM output onto one of ``LABELS``; None if it is neither."""
+    text = str(label).strip().strip(".").lower()
+    if text.startswith("non"):
+        return NON_RECOMMENDATION
+    if text.startswith("recommendation"):
+        return RECOMMENDATION
+    return None
+
+
+def loadExamples(path):
+    """Reads ``(query, label)`` pairs from a JSONL intent log, skipping malformed lines."""
+    examples = []
+    if not path or not os.path.exists(path):
+        return examples
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            label = normalizeLabel(record.get("intent", ""))
+            if label and record.get("query"):
+                examples.append((record["query"], label))
+    return examples
+
+
+def logExample(path, query, intent):
+    """Appends one LLM-labeled query to the intent log used for training."""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"query": query, "intent": intent}) + "\n")
+
+
+def trainDefault(log_path=None):
+    """Trains and calibrates on the seed examples plus, when available, logged LLM labels."""
+    examples = SEED_EXAMPLES + loadExamples(log_path)
+    return IntentClassifier().fit(examples).calibrate(examples)
@@ -0,0 +1,397 @@
+"""
+Client-side scheduling for LLM requests: adaptive concurrency, retries with
+backoff, per-call deadlines and optional hedging.
+
+- ``AdaptiveLimiter`` caps in-flight requests with an AIMD limit: it grows by
+  about one per round trip while calls succeed within LLM_LATENCY_TARGET, and
+  halves on a 429 (at most once per cooldown, so one burst of 429s counts as
+  one signal). Threads and coroutines share the same limit.
+- Retries use full-jitter exponential backoff, and wait at least as long as
+  a ``retry-after`` header asks. No sleep runs past the call's deadline.
+- With hedging on, a call that is still running after the recent p95
+  latency gets one duplicate request; whichever answers first wins.
+
+``LLMScheduler.call`` and ``acall`` take a function of the remaining timeout
+in seconds, e.g. ``lambda timeout: client.responses.create(..., timeout=timeout)``.
+Streams are opened with ``hold=True``: the concurrency slot stays taken while
+the stream is read and is handed back with ``release()``.
+"""
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call's deadline passed before an attempt succeeded."""
+
+
+class Overloaded(RuntimeError):
+    """Retries ran out while the provider kept rate limiting; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retryAfter(error):
+    """Seconds from a ``retry-after`` header on an OpenAI error, or None."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def classify(error):
+    """Returns "rate_limit", "server", "timeout" or "connection" for retryable errors, else None."""
+    import openai
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limit"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection"
+    if isinstance(error, openai.APIStatusError) and error.status_code >= 500:
+        return "server"
+    return None
+
+
+def backoff(attempt, base=0.25, cap=8.0, retry_after=None):
+    """Full-jitter exponential delay for ``attempt`` (0-based), never shorter than ``retry_after``."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, base)
+    return delay
+
+
+class _Waiter:
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit shared by threads and event loops."""
+
+    def __init__(self, initial=16, minimum=1, maximum=128, latency_target=None,
+                 decrease=0.5, cooldown=1.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.inflight = 0
+        self._last_decrease = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _grantLocked(self):
+        # Hand free slots to waiters in arrival order
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.future is not None:
+                if waiter.future.done():
+                    continue
+                waiter.granted = True
+                self.inflight += 1
+                waiter.loop.call_soon_threadsafe(self._resolve, waiter)
+            else:
+                waiter.granted = True
+                self.inflight += 1
+                waiter.event.set()
+
+    def _resolve(self, waiter):
+        if waiter.future.done():
+            # Cancelled after the slot was handed over; pass it on
+            self.release()
+        else:
+            waiter.future.set_result(True)
+
+    def tryAcquire(self):
+        with self._lock:
+            if not self._waiters and self.inflight < int(self.limit):
+                self.inflight += 1
+                return True
+            return False
+
+    def acquire(self, timeout=None):
+        """Blocks until a slot is free; returns False if ``timeout`` passes first."""
+        with self._lock:
+            if not self._waiters and self.inflight < int(self.limit):
+                self.inflight += 1
+                return True
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+        if waiter.event.wait(timeout):
+            return True
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+        return False
+
+    async def aacquire(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self.inflight < int(self.limit):
+                self.inflight += 1
+                return True
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._abandon(waiter)
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+
+    def _abandon(self, waiter):
+        # Returns True if the slot was already handed over and is now ours
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return False
+            if waiter.future.done() and not waiter.future.cancelled():
+                return True
+            # Granted but not yet delivered; _resolve will release it
+            waiter.future.cancel()
+            return False
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+            self._grantLocked()
+
+    def onResult(self, latency, rate_limited=False):
+        """Feeds one outcome into the AIMD limit."""
+        now = time.monotonic()
+        with self._lock:
+            if rate_limited or (self.latency_target and latency > self.latency_target):
+                if now - self._last_decrease >= self.cooldown:
+                    factor = self.decrease if rate_limited else 0.9
+                    self.limit = max(self.minimum, self.limit * factor)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self._grantLocked()
+
+
+class LatencyTracker:
+    """Recent successful latencies, for the hedging threshold."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, min_samples=20):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+class LLMScheduler:
+
+    def __init__(self, limiter=None, max_retries=4, deadline=30.0, hedge=False,
+                 hedge_percentile=95, hedge_min_samples=20):
+        self.limiter = limiter or AdaptiveLimiter()
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = LatencyTracker()
+
+    def _hedgeDelay(self, hedge=True):
+        if not (self.hedge and hedge):
+            return None
+        return self.latencies.percentile(self.hedge_percentile, self.hedge_min_samples)
+
+    def release(self):
+        """Hands back the slot of a call made with ``hold=True``."""
+        self.limiter.release()
+
+    def _attempt(self, fn, timeout, hold=False):
+        started = time.perf_counter()
+        try:
+            result = fn(timeout)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                self.limiter.onResult(time.perf_counter() - started, rate_limited=classify(e) == "rate_limit")
+            self.limiter.release()
+            raise
+        if hold:
+            # An open stream says nothing about how long a response takes
+            return result
+        self.limiter.release()
+        latency = time.perf_counter() - started
+        self.limiter.onResult(latency)
+        self.latencies.add(latency)
+        return result
+
+    def _hedged(self, fn, timeout, hedge=True):
+        delay = self._hedgeDelay(hedge)
+        if delay is None or delay >= timeout:
+            return self._attempt(fn, timeout)
+        first = _hedge_executor.submit(contextvars.copy_context().run, self._attempt, fn, timeout)
+        done, _ = wait([first], timeout=delay)
+        if done or not self.limiter.tryAcquire():
+            return first.result()
+        metrics.LLM_HEDGES.inc(1, "sent")
+        second = _hedge_executor.submit(contextvars.copy_context().run, self._attempt, fn, max(0.001, timeout - delay))
+        done, _ = wait([first, second], return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        if winner is second:
+            metrics.LLM_HEDGES.inc(1, "won")
+        # The slower request finishes in the background and frees its slot then
+        if winner.exception() is not None:
+            other = second if winner is first else first
+            return other.result()
+        return winner.result()
+
+    def call(self, fn, deadline=None, hedge=True, hold=False):
+        """
+        Runs ``fn(timeout)`` under the limiter with retries until ``deadline``
+        seconds pass. Pass ``hedge=False`` for calls that must not be
+        duplicated. With ``hold`` (for opening a stream) the call is never
+        hedged, its latency is not recorded and its slot stays taken after it
+        returns, until ``release()``.
+        """
+        end = time.monotonic() + (deadline or self.deadline)
+        for attempt in range(self.max_retries + 1):
+            remaining = end - time.monotonic()
+            if remaining <= 0 or not self.limiter.acquire(timeout=remaining):
+                raise DeadlineExceeded("LLM call deadline exceeded while waiting for capacity")
+            try:
+                if hold:
+                    return self._attempt(fn, end - time.monotonic(), hold=True)
+                return self._hedged(fn, end - time.monotonic(), hedge)
+            except Exception as e:
+                kind = classify(e)
+                delay = backoff(attempt, retry_after=retryAfter(e)) if kind else None
+                if kind is None or attempt == self.max_retries or time.monotonic() + delay >= end:
+                    if kind == "rate_limit":
+                        raise Overloaded("LLM provider is rate limiting", retryAfter(e)) from e
+                    if kind == "timeout" and time.monotonic() >= end:
+                        raise DeadlineExceeded("LLM call deadline exceeded") from e
+                    raise
+                metrics.LLM_RETRIES.inc(1, kind)
+                time.sleep(delay)
+
+    async def _aattempt(self, factory, timeout, hold=False):
+        started = time.perf_counter()
+        try:
+            result = await factory(timeout)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                self.limiter.onResult(time.perf_counter() - started, rate_limited=classify(e) == "rate_limit")
+            self.limiter.release()
+            raise
+        if hold:
+            return result
+        self.limiter.release()
+        latency = time.perf_counter() - started
+        self.limiter.onResult(latency)
+        self.latencies.add(latency)
+        return result
+
+    async def _ahedged(self, factory, timeout, hedge=True):
+        delay = self._hedgeDelay(hedge)
+        if delay is None or delay >= timeout:
+            return await self._aattempt(factory, timeout)
+        first = asyncio.ensure_future(self._aattempt(factory, timeout))
+        done, _ = await asyncio.wait([first], timeout=delay)
+        if done or not self.limiter.tryAcquire():
+            return await first
+        metrics.LLM_HEDGES.inc(1, "sent")
+        second = asyncio.ensure_future(self._aattempt(factory, max(0.001, timeout - delay)))
+        tasks = [first, second]
+        try:
+            while tasks:
+                done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        if task is second:
+                            metrics.LLM_HEDGES.inc(1, "won")
+                        return task.result()
+                if not tasks:
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def acall(self, factory, deadline=None, hedge=True, hold=False):
+        """Async form of ``call``; ``factory(timeout)`` returns an awaitable."""
+        end = time.monotonic() + (deadline or self.deadline)
+        for attempt in range(self.max_retries + 1):
+            remaining = end - time.monotonic()
+            if remaining <= 0 or not await self.limiter.aacquire(timeout=remaining):
+                raise DeadlineExceeded("LLM call deadline exceeded while waiting for capacity")
+            try:
+                if hold:
+                    return await self._aattempt(factory, end - time.monotonic(), hold=True)
+                return await self._ahedged(factory, end - time.monotonic(), hedge)
+            except Exception as e:
+                kind = classify(e)
+                delay = backoff(attempt, retry_after=retryAfter(e)) if kind else None
+                if kind is None or attempt == self.max_retries or time.monotonic() + delay >= end:
+                    if kind == "rate_limit":
+                        raise Overloaded("LLM provider is rate limiting", retryAfter(e)) from e
+                    if kind == "timeout" and time.monotonic() >= end:
+                        raise DeadlineExceeded("LLM call deadline exceeded") from e
+                    raise
+                metrics.LLM_RETRIES.inc(1, kind)
+                await asyncio.sleep(delay)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def getScheduler():
+    """
+    Returns the process-wide scheduler configured from LLM_CONCURRENCY,
+    LLM_MIN_CONCURRENCY, LLM_MAX_CONCURRENCY, LLM_LATENCY_TARGET,
+    LLM_MAX_RETRIES, LLM_DEADLINE and LLM_HEDGE.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                target = float(os.getenv("LLM_LATENCY_TARGET", "0")) or None
+                _scheduler = LLMScheduler(
+                    limiter=AdaptiveLimiter(
+                        initial=int(os.getenv("LLM_CONCURRENCY", "16")),
+                        minimum=int(os.getenv("LLM_MIN_CONCURRENCY", "1")),
+                        maximum=int(os.getenv("LLM_MAX_CONCURRENCY", "128")),
+                        latency_target=target
+                    ),
+                    max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+                    deadline=float(os.getenv("LLM_DEADLINE", "30")),
+                    hedge=os.getenv("LLM_HEDGE", "0") == "1"
+                )
+    return _scheduler
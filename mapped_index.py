@@ -0,0 +1,244 @@
+"""
+Read-only, memory-mapped export of the catalog index for multi-worker APIs.
+
+Every API worker that opens Chroma (or builds a ``CatalogIndex``) holds its
+own copy of every embedding. ``exportIndex`` writes the catalog once as plain
+files, and ``MappedCatalogIndex`` maps them read-only with
+``np.load(mmap_mode="r")``, so all workers on a host share the same pages
+through the OS page cache:
+
+    <root>/<version>/matrix.npy   normalized rows (float32, float16 or int8)
+    <root>/<version>/scales.npy   int8 row scales
+    <root>/<version>/full.npy     float32 rows for rescoring a quantized matrix
+    <root>/<version>/rows.json    ids, metadatas and documents
+    <root>/CURRENT                name of the live version
+
+A version directory is complete before it is renamed into place and
+``CURRENT`` is replaced atomically, so readers never see a partial export.
+Workers stat ``CURRENT`` on each query and switch to a new version without a
+restart. Old versions are pruned; unlinking files a worker still maps is safe.
+
+    python mapped_index.py --path catalog --out catalog_index
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from precomputed import catalogFingerprint
+from vector_index import CatalogIndex, IndexSnapshot, baseCollection, quantizeRows, truncateRows
+
+CURRENT_FILE = "CURRENT"
+KEEP_VERSIONS = 3
+READERS_DIR = ".readers"
+
+
+def readCurrent(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def writeCurrent(root, version):
+    target = os.path.join(root, CURRENT_FILE)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, target)
+
+
+def _processAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def holdVersion(root, version):
+    """
+    Records that this process has ``version`` open, so ``pruneVersions``
+    keeps it, and returns the callable that releases it. Holds left by
+    processes that died are ignored.
+    """
+    readers = os.path.join(root, READERS_DIR)
+    os.makedirs(readers, exist_ok=True)
+    fd, marker = tempfile.mkstemp(prefix=f"{version}.{os.getpid()}.", dir=readers)
+    os.close(fd)
+
+    def release():
+        try:
+            os.remove(marker)
+        except OSError:
+            pass
+    return release
+
+
+def heldVersions(root):
+    """Versions some live process holds open; markers of dead processes are removed."""
+    readers = os.path.join(root, READERS_DIR)
+    try:
+        markers = os.listdir(readers)
+    except OSError:
+        return set()
+    held = set()
+    for marker in markers:
+        try:
+            version, pid, _ = marker.rsplit(".", 2)
+            pid = int(pid)
+        except ValueError:
+            continue
+        if _processAlive(pid):
+            held.add(version)
+        else:
+            try:
+                os.remove(os.path.join(readers, marker))
+            except OSError:
+                pass
+    return held
+
+
+def pruneVersions(root, keep=KEEP_VERSIONS):
+    """Deletes all but the newest ``keep`` versions, never the current one or one a reader holds."""
+    current = readCurrent(root)
+    versions = sorted(name for name in os.listdir(root)
+                      if not name.startswith(".") and os.path.isdir(os.path.join(root, name)))
+    held = heldVersions(root)
+    for name in versions[:-keep] if keep else versions:
+        if name != current and name not in held:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def exportIndex(collection, root, dimensions=None, quantization="float32", keep=KEEP_VERSIONS):
+    """Writes ``collection`` as a new version under ``root``, makes it current and returns its name."""
+    data = baseCollection(collection).get(include=["embeddings", "metadatas", "documents"])
+    full = truncateRows(data["embeddings"], dimensions)
+    matrix, scales = quantizeRows(full, quantization)
+    version = f"{int(time.time() * 1000)}-{catalogFingerprint(collection)[:12]}"
+
+    os.makedirs(root, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".export-", dir=root)
+    os.chmod(staging, 0o755)
+    np.save(os.path.join(staging, "matrix.npy"), matrix)
+    if scales is not None:
+        np.save(os.path.join(staging, "scales.npy"), scales)
+    if matrix.dtype != np.float32:
+        np.save(os.path.join(staging, "full.npy"), np.ascontiguousarray(full, dtype=np.float32))
+    with open(os.path.join(staging, "rows.json"), "w", encoding="utf-8") as f:
+        json.dump({"ids": list(data["ids"]), "metadatas": data["metadatas"], "documents": data["documents"]}, f)
+    os.rename(staging, os.path.join(root, version))
+    writeCurrent(root, version)
+    pruneVersions(root, keep)
+    return version
+
+
+class MappedCatalogIndex(CatalogIndex):
+    """
+    ``CatalogIndex`` over the current exported version, memory-mapped read-only.
+
+    Besides ``query`` it answers ``get`` for the ids, metadatas and documents
+    that the BM25 and precomputed wrappers read, so a worker using it never
+    opens Chroma.
+    """
+
+    def __init__(self, root, embedding_function, rescore=4):
+        self.root = root
+        self.embedding_function = embedding_function
+        self.rescore = rescore
+        self.version = None
+        self._mtime = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _currentMtime(self):
+        try:
+            return os.stat(os.path.join(self.root, CURRENT_FILE)).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self, version):
+        directory = os.path.join(self.root, version)
+        with open(os.path.join(directory, "rows.json"), encoding="utf-8") as f:
+            rows = json.load(f)
+        matrix = np.load(os.path.join(directory, "matrix.npy"), mmap_mode="r")
+        scales_path = os.path.join(directory, "scales.npy")
+        scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        full_path = os.path.join(directory, "full.npy")
+        full = np.load(full_path, mmap_mode="r") if os.path.exists(full_path) else None
+        return IndexSnapshot(rows["ids"], matrix, rows["metadatas"], rows["documents"], rescore=self.rescore,
+                             fetch=(lambda idx: full[idx]) if full is not None else None,
+                             prepared=True, scales=scales)
+
+    def refresh(self):
+        """Maps the version named in ``CURRENT`` if it is not the one already in use."""
+        with self._lock:
+            self._mtime = self._currentMtime()
+            version = readCurrent(self.root)
+            if version is None:
+                raise FileNotFoundError(f"No exported catalog index under {self.root!r}; run mapped_index.py")
+            if version != self.version:
+                self._snapshot = self.load(version)
+                self.version = version
+            return self._snapshot
+
+    def checkVersion(self):
+        """
+        Maps a newly published version when ``CURRENT`` has changed and returns
+        the version in use. The BM25 and precomputed wrappers call it on each
+        lookup and rebuild their own state when it changes.
+        """
+        if self._currentMtime() != self._mtime:
+            self.refresh()
+        return self.version
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None, **kwargs):
+        self.checkVersion()
+        return super().query(query_texts=query_texts, query_embeddings=query_embeddings,
+                             n_results=n_results, where=where, **kwargs)
+
+    def get(self, ids=None, include=("metadatas", "documents"), **kwargs):
+        """The subset of ``Collection.get`` the catalog wrappers use."""
+        snapshot = self._snapshot
+        if ids is None:
+            rows = list(range(len(snapshot)))
+        else:
+            position = {record_id: n for n, record_id in enumerate(snapshot.ids)}
+            rows = [position[record_id] for record_id in ids if record_id in position]
+        result = {"ids": [snapshot.ids[n] for n in rows]}
+        if "metadatas" in include:
+            result["metadatas"] = [snapshot.metadatas[n] for n in rows]
+        if "documents" in include:
+            result["documents"] = [snapshot.documents[n] for n in rows]
+        if "embeddings" in include:
+            vectors = snapshot.fetch(rows) if snapshot.fetch is not None else snapshot.matrix[rows]
+            result["embeddings"] = np.asarray(vectors, dtype=np.float32)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the catalog collection as a memory-mapped index.")
+    parser.add_argument("--path", default="catalog", help="Chroma persistence directory")
+    parser.add_argument("--out", default=os.getenv("CATALOG_INDEX_PATH", "catalog_index"))
+    parser.add_argument("--quantization", default=os.getenv("CATALOG_QUANTIZATION", "float32"))
+    parser.add_argument("--keep", type=int, default=KEEP_VERSIONS)
+    args = parser.parse_args()
+
+    import chromadb
+    collection = chromadb.PersistentClient(path=args.path).get_collection("catalogs")
+    version = exportIndex(collection, args.out, dimensions=int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None,
+                          quantization=args.quantization, keep=args.keep)
+    print(f"Exported {collection.count()} rows to {os.path.join(args.out, version)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Lightweight timing spans, histograms and counters in Prometheus text format.
+
+Code that does slow work wraps it in ``span(stage)``; the surrounding
+``instrumented(name)`` function (``findIntent``, ``getProducts``, ...) tags the
+span with its operation through a context variable, so ``callLLM`` and the
+embedding function report who called them without extra arguments. A span
+costs two ``perf_counter`` calls and one locked bucket update.
+
+When a request is wrapped in ``traceRequest()`` every span it records is also
+collected for the structured per-request log (METRICS_REQUEST_LOG).
+"""
+import asyncio
+import bisect
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+_operation = contextvars.ContextVar("operation", default=None)
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def _labelText(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for values, (counts, total, count) in sorted(series.items()):
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labelText(self.labels + ('le',), values + (le,))} {running}")
+            lines.append(f"{self.name}_sum{_labelText(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_labelText(self.labels, values)} {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values."""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return renderFamily(self.name, self.help, "counter",
+                            [(dict(zip(self.labels, k)), v) for k, v in sorted(values.items())])
+
+
+def renderFamily(name, help, kind, samples):
+    """Formats ``[(labels_dict, value), ...]`` as one Prometheus metric family."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labelText(tuple(labels), tuple(labels.values()))} {value}")
+    return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram(
+    "skincare_stage_seconds", "Time spent per pipeline stage", ("stage", "operation"))
+STAGE_ERRORS = Counter(
+    "skincare_stage_errors_total", "Stages that raised", ("stage", "operation"))
+LLM_TTFT_SECONDS = Histogram(
+    "skincare_llm_ttft_seconds", "Time to first streamed token", ("operation",))
+LLM_TOKENS = Counter(
+    "skincare_llm_tokens_total", "LLM tokens reported by the API", ("operation", "type"))
+RAG_CONTEXT_TOKENS = Counter(
+    "skincare_rag_context_tokens_total", "Retrieved-context tokens before and after budgeting", ("kind",))
+PRECOMPUTED_LOOKUPS = Counter(
+    "skincare_precomputed_lookups_total", "Catalog queries answered from the precomputed table", ("result",))
+COALESCED_CALLS = Counter(
+    "skincare_coalesced_calls_total", "Calls sent upstream vs. collapsed into an identical in-flight call", ("call", "result"))
+LLM_RETRIES = Counter(
+    "skincare_llm_retries_total", "LLM attempts retried after a retryable error", ("reason",))
+LLM_HEDGES = Counter(
+    "skincare_llm_hedges_total", "Hedged LLM requests sent, and how many answered first", ("result",))
+FIRST_TURN_CALLS = Counter(
+    "skincare_first_turn_calls_total", "Combined intent and follow-up calls, and how many fell back to two calls", ("result",))
+CATALOG_SWAPS = Counter(
+    "skincare_catalog_swaps_total", "Catalog versions swapped in, or that failed to open", ("result",))
+CATALOG_STALENESS_SECONDS = Histogram(
+    "skincare_catalog_staleness_seconds", "Time from a catalog source change until its version serves queries",
+    buckets=(1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0, 3600.0))
+REQUEST_SECONDS = Histogram(
+    "skincare_http_request_seconds", "API request latency until the response starts", ("method", "path", "status"))
+
+METRICS = [STAGE_SECONDS, STAGE_ERRORS, LLM_TTFT_SECONDS, LLM_TOKENS, RAG_CONTEXT_TOKENS, PRECOMPUTED_LOOKUPS, COALESCED_CALLS,
+           LLM_RETRIES, LLM_HEDGES, FIRST_TURN_CALLS, CATALOG_SWAPS, CATALOG_STALENESS_SECONDS, REQUEST_SECONDS]
+
+
+def currentOperation():
+    return _operation.get() or "unknown"
+
+
+def observe(stage, seconds, operation=None):
+    """Records a finished stage; also appends it to the request trace if one is active."""
+    if not ENABLED:
+        return
+    operation = operation or currentOperation()
+    STAGE_SECONDS.observe(seconds, stage, operation)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append({"stage": stage, "operation": operation, "ms": round(seconds * 1000, 2)})
+
+
+@contextmanager
+def span(stage, operation=None):
+    """Times the enclosed block as ``stage`` of the current (or given) operation."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if ENABLED:
+            STAGE_ERRORS.inc(1, stage, operation or currentOperation())
+        raise
+    finally:
+        observe(stage, time.perf_counter() - started, operation)
+
+
+def instrumented(name):
+    """
+    Decorator that tags everything the function does with operation ``name``
+    and records its own duration as the ``total`` stage. Works on plain and
+    async functions.
+    """
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                token = _operation.set(name)
+                try:
+                    with span("total", name):
+                        return await fn(*args, **kwargs)
+                finally:
+                    _operation.reset(token)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                token = _operation.set(name)
+                try:
+                    with span("total", name):
+                        return fn(*args, **kwargs)
+                finally:
+                    _operation.reset(token)
+        return wrapper
+    return decorate
+
+
+def recordTokens(usage, operation=None):
+    """Adds an OpenAI ``usage`` object (input/output tokens) to the token counters."""
+    if not ENABLED or usage is None:
+        return
+    operation = operation or currentOperation()
+    for kind in ("input_tokens", "output_tokens"):
+        value = getattr(usage, kind, None)
+        if value is None and isinstance(usage, dict):
+            value = usage.get(kind)
+        if value:
+            LLM_TOKENS.inc(value, operation, kind.replace("_tokens", ""))
+
+
+def annotate(stage, **values):
+    """Adds a non-timing entry (e.g. token counts) to the current request trace."""
+    trace = _trace.get()
+    if ENABLED and trace is not None:
+        trace.append(dict(values, stage=stage, operation=currentOperation()))
+
+
+def recordTTFT(seconds, operation=None):
+    if ENABLED:
+        LLM_TTFT_SECONDS.observe(seconds, operation or currentOperation())
+
+
+_log_lock = threading.Lock()
+
+
+@contextmanager
+def traceRequest(**fields):
+    """
+    Collects the spans recorded inside the block. On exit the list is written
+    as one JSON line to METRICS_REQUEST_LOG, if set. Yields the field dict so
+    callers can add e.g. the response status.
+    """
+    spans = []
+    token = _trace.set(spans)
+    started = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        _trace.reset(token)
+        path = os.getenv("METRICS_REQUEST_LOG")
+        if path:
+            entry = dict(fields, ts=time.time(), total_ms=round((time.perf_counter() - started) * 1000, 2), spans=spans)
+            line = json.dumps(entry, ensure_ascii=False)
+            with _log_lock:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+
+
+def render(extra=()):
+    """Prometheus text exposition of all metrics plus any ``extra`` pre-rendered families."""
+    return "\n".join([m.render() for m in METRICS] + list(extra)) + "\n"
@@ -0,0 +1,236 @@
+"""
+Orchestration of the first recommendation turn, shared by app.py, main.py and api.py.
+
+The first turn needs an intent label, product retrieval and follow-up
+questions (recommendation path) or docs retrieval (RAG path). None of these
+depend on each other's output, so when the local classifier cannot decide
+the intent on its own, everything is started at once: the LLM intent call,
+product retrieval, follow-up generation and, if a docs collection is given,
+docs retrieval. Once the intent is known the work it does not need is
+cancelled. End-to-end latency is then roughly the slowest single call
+rather than their sum.
+
+FIRST_TURN_MODE picks how the LLM is asked when the local classifier is
+unsure: ``parallel`` (default) sends the intent and follow-up prompts as two
+calls, ``combined`` sends one structured call that returns both
+(``utils.intentAndQuestions``). Either can also be passed as ``mode``.
+"""
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import utils
+from intent_classifier import RECOMMENDATION
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PIPELINE_WORKERS", "16")),
+    thread_name_prefix="pipeline"
+)
+
+_DONE = object()
+FIRST_TURN_MODES = ("parallel", "combined")
+
+
+class BackgroundStream:
+    """
+    Drains a text-delta generator on a worker thread so generation starts
+    immediately; iterating yields the deltas as they arrive. ``cancel()``
+    stops the producer and closes the underlying stream.
+    """
+
+    def __init__(self, deltas):
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self.text = ""
+        self.error = None
+        self._future = _submit(self._produce, deltas)
+
+    def _produce(self, deltas):
+        try:
+            for delta in deltas:
+                if self._cancelled.is_set():
+                    break
+                self._queue.put(delta)
+        except Exception as e:
+            self.error = e
+        finally:
+            deltas.close()
+            self._queue.put(_DONE)
+
+    def __iter__(self):
+        while True:
+            delta = self._queue.get()
+            if delta is _DONE:
+                self._queue.put(_DONE)
+                if self.error is not None:
+                    raise self.error
+                return
+            self.text += delta
+            yield delta
+
+    def result(self):
+        """Blocks until generation finishes and returns the full text."""
+        for _ in self:
+            pass
+        return self.text
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+def _submit(fn, *args, **kwargs):
+    # Copy the caller's context so metric spans recorded on the worker thread
+    # still land in the current request's trace.
+    return _executor.submit(contextvars.copy_context().run, partial(fn, *args, **kwargs))
+
+
+def _inThread(fn, *args, **kwargs):
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(_executor, context.run, partial(fn, *args, **kwargs))
+
+
+def _firstTurnMode(mode):
+    mode = (mode or os.getenv("FIRST_TURN_MODE", "parallel")).lower()
+    if mode not in FIRST_TURN_MODES:
+        raise ValueError(f"Unknown first-turn mode {mode!r}; expected one of {FIRST_TURN_MODES}")
+    return mode
+
+
+def _replay(text):
+    # The combined call returns the questions whole; they are handed to the
+    # page as a stream with a single delta.
+    yield text
+
+
+def _cancel(work):
+    # Futures that already started keep running, but their result is dropped;
+    # a BackgroundStream stops reading and closes its HTTP stream.
+    if work is not None:
+        work.cancel()
+
+
+def firstTurn(query, catalog_collection, docs_collection=None, stream_questions=False, n_docs=5, mode=None):
+    """
+    Runs the first turn and returns a dict with ``intent`` and either
+    ``products`` and ``questions`` (recommendation) or ``hits`` (docs results,
+    when ``docs_collection`` is given).
+
+    With ``stream_questions`` the ``questions`` value is a ``BackgroundStream``
+    that is already generating; otherwise it is the finished text. If the
+    intent call or the product search fails, the work still running is
+    cancelled before the error is raised.
+    """
+    intent = utils.localIntent(query)
+    speculative = intent is None
+    combined = speculative and _firstTurnMode(mode) == "combined"
+    want_recommendation = speculative or intent == RECOMMENDATION
+    want_docs = docs_collection is not None and (speculative or intent != RECOMMENDATION)
+
+    intent_future = None
+    if speculative:
+        intent_future = _submit(utils.intentAndQuestions if combined else utils.llmIntent, query)
+    products = _submit(utils.getProducts, query, catalog_collection) if want_recommendation else None
+    if want_recommendation and not combined:
+        questions = (BackgroundStream(utils.streamRecommQuestion(query)) if stream_questions
+                     else _submit(utils.recommQuestion, query))
+    else:
+        questions = None
+    hits = _submit(utils.queryDocs, query, docs_collection, n_docs) if want_docs else None
+
+    if intent_future is not None:
+        try:
+            intent = intent_future.result()
+        except BaseException:
+            for work in (products, questions, hits):
+                _cancel(work)
+            raise
+        if combined:
+            intent, asked = intent
+            questions = BackgroundStream(_replay(asked)) if stream_questions and asked is not None else asked
+
+    if intent == RECOMMENDATION:
+        _cancel(hits)
+        try:
+            found = products.result()
+        except BaseException:
+            # A streaming questions call holds an LLM slot until it is closed
+            _cancel(questions)
+            raise
+        return {
+            "intent": intent,
+            "products": found,
+            "questions": questions if stream_questions or combined else questions.result(),
+        }
+
+    _cancel(products)
+    _cancel(questions)
+    return {"intent": intent, "hits": hits.result() if hits is not None else None}
+
+
+async def afirstTurn(query, catalog_collection, docs_collection=None, n_docs=5, pool_size=None, mode=None):
+    """
+    Async form of ``firstTurn`` for the API. Speculative tasks the intent
+    does not need are cancelled, which also aborts their HTTP requests.
+
+    With ``pool_size`` the ``pool_size`` nearest products are fetched instead
+    and returned as ``candidates``; ``products`` is derived from them.
+    """
+    intent = utils.localIntent(query)
+    speculative = intent is None
+    combined = speculative and _firstTurnMode(mode) == "combined"
+    want_recommendation = speculative or intent == RECOMMENDATION
+    want_docs = docs_collection is not None and (speculative or intent != RECOMMENDATION)
+
+    products = questions = hits = asked = None
+    if want_recommendation:
+        if pool_size:
+            products = _inThread(utils.getCandidates, query, catalog_collection, pool_size)
+        else:
+            products = _inThread(utils.getProducts, query, catalog_collection)
+        if not combined:
+            questions = asyncio.create_task(utils.arecommQuestion(query))
+    if want_docs:
+        hits = _inThread(utils.queryDocs, query, docs_collection, n_docs)
+
+    try:
+        if combined:
+            intent, asked = await utils.aintentAndQuestions(query)
+        elif speculative:
+            intent = await utils.allmIntent(query)
+    except BaseException:
+        for task in (products, questions, hits):
+            _cancel(task)
+        raise
+
+    if intent == RECOMMENDATION:
+        _cancel(hits)
+        try:
+            if questions is not None:
+                found, asked = await asyncio.gather(products, questions)
+            else:
+                found = await products
+        except BaseException:
+            _cancel(products)
+            _cancel(questions)
+            raise
+        if pool_size:
+            return {"intent": intent, "products": utils.productsFromCandidates(found),
+                    "candidates": found, "questions": asked}
+        return {"intent": intent, "products": found, "questions": asked}
+
+    _cancel(products)
+    _cancel(questions)
+    return {"intent": intent, "hits": await hits if hits is not None else None}
+
+
+def finalTurn(query, answers, catalog_collection):
+    """
+    Second turn: builds the enriched query from the follow-up answers and
+    retrieves the final products. Returns ``(final_query, products)``.
+    """
+    final_query = utils.recommFinalQuery(query, answers)
+    return final_query, utils.getProducts(final_query, catalog_collection)
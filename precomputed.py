@@ -0,0 +1,214 @@
+"""
+Precomputed catalog results for hot queries.
+
+The first-turn product lookup is dominated by a handful of broad queries:
+the catalog's own category names ("serum", "toners", ...) and whatever users
+ask most often. ``PrecomputedCatalog`` wraps the catalog engine, runs those
+queries once in a single batched lookup when it is created, and afterwards
+answers them from a dict; anything else is passed through.
+
+Catalog ingestion writes a fingerprint of the synced rows to
+``<store>/catalog_version`` (``writeCatalogVersion``). The wrapper checks that
+file's mtime on every lookup and, when the fingerprint changes, drops the
+table, refreshes the wrapped engine and warms again in the background. The
+same happens when a wrapped engine with ``checkVersion`` (the memory-mapped
+index, through ``bm25.HybridCatalog``) reports a new version.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+
+import metrics
+from cache import normalizeText
+from vector_index import baseCollection
+
+VERSION_FILE = "catalog_version"
+PRECOMPUTED_TOP_QUERIES = int(os.getenv("PRECOMPUTED_TOP_QUERIES", "50"))
+PRECOMPUTED_RESULTS = 5
+
+
+def catalogFingerprint(collection):
+    """Hash of every id and its metadata (including ``content_hash``)."""
+    data = baseCollection(collection).get(include=["metadatas"])
+    rows = sorted(zip(data["ids"], (json.dumps(m, sort_keys=True, default=str) for m in data["metadatas"])))
+    return hashlib.sha256(json.dumps(rows).encode("utf-8")).hexdigest()
+
+
+def writeCatalogVersion(path, fingerprint):
+    """Atomically records the fingerprint of the catalog stored under ``path``."""
+    target = os.path.join(path, VERSION_FILE)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(fingerprint)
+    os.replace(tmp, target)
+
+
+def readCatalogVersion(path):
+    try:
+        with open(os.path.join(path, VERSION_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def plural(word):
+    if word.endswith(("s", "x", "sh", "ch")):
+        return word + "es"
+    if word.endswith("y") and word[-2:-1] not in "aeiou":
+        return word[:-1] + "ies"
+    return word + "s"
+
+
+def categoryQueries(collection):
+    """Category names from the catalog metadata, their "/"-separated parts and plurals."""
+    queries = set()
+    for meta in baseCollection(collection).get(include=["metadatas"])["metadatas"]:
+        category = str((meta or {}).get("category") or "").strip().lower()
+        if not category:
+            continue
+        queries.add(category)
+        for part in category.split("/"):
+            part = part.strip()
+            if part:
+                queries.update((part, plural(part)))
+    return queries
+
+
+def frequentQueries(log_path, limit=PRECOMPUTED_TOP_QUERIES):
+    """Most frequent recommendation queries in the intent log (JSONL of query/intent)."""
+    counts = Counter()
+    if not log_path or not os.path.exists(log_path):
+        return []
+    with open(log_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("query") and record.get("intent") == "Recommendation":
+                counts[normalizeText(record["query"])] += 1
+    return [query for query, _ in counts.most_common(limit)]
+
+
+def _key(text, n_results, where):
+    return normalizeText(text), n_results, json.dumps(where, sort_keys=True) if where else None
+
+
+class PrecomputedCatalog:
+    """
+    Serves precomputed ``query`` results for hot queries and forwards the rest
+    to the wrapped catalog engine. ``path`` is the catalog's Chroma directory,
+    where ingestion writes the version file.
+    """
+
+    def __init__(self, collection, path=None, queries=None, n_results=PRECOMPUTED_RESULTS, warm=True):
+        self.collection = collection
+        self.path = path
+        self.n_results = n_results
+        self._queries = queries
+        self._table = {}
+        self._version = None
+        self._mtime = self._versionMtime()
+        self._source_version = self._sourceVersion()
+        self._lock = threading.Lock()
+        self._warming = None
+        if warm:
+            self.warm()
+
+    def _versionMtime(self):
+        if not self.path:
+            return None
+        try:
+            return os.stat(os.path.join(self.path, VERSION_FILE)).st_mtime_ns
+        except OSError:
+            return None
+
+    def hotQueries(self):
+        if self._queries is not None:
+            return sorted({normalizeText(q) for q in self._queries})
+        queries = categoryQueries(self.collection)
+        queries.update(frequentQueries(os.getenv("INTENT_LOG_PATH")))
+        return sorted(queries)
+
+    def warm(self):
+        """Runs every hot query in one batched lookup and swaps in the new table."""
+        version = catalogFingerprint(self.collection)
+        queries = self.hotQueries()
+        table = {}
+        if queries:
+            with metrics.span("precompute", "PrecomputedCatalog"):
+                data = self.collection.query(query_texts=queries, n_results=self.n_results)
+            fields = [field for field in ("ids", "distances", "metadatas", "documents") if data.get(field) is not None]
+            for n, query in enumerate(queries):
+                table[_key(query, self.n_results, None)] = {field: [data[field][n]] for field in fields}
+        with self._lock:
+            self._table = table
+            self._version = version
+        return len(table)
+
+    def invalidate(self, rewarm=True):
+        """Drops the table, refreshes the wrapped engine and (optionally) warms again in the background."""
+        with self._lock:
+            self._table = {}
+            self._version = None
+            if not rewarm or (self._warming is not None and self._warming.is_alive()):
+                return
+
+            def rebuild():
+                if hasattr(self.collection, "refresh"):
+                    self.collection.refresh()
+                self.warm()
+
+            self._warming = threading.Thread(target=rebuild, name="precompute-warm", daemon=True)
+            self._warming.start()
+
+    def _sourceVersion(self):
+        return self.collection.checkVersion() if hasattr(self.collection, "checkVersion") else None
+
+    def _checkSource(self):
+        version = self._sourceVersion()
+        if version != self._source_version:
+            self._source_version = version
+            self.invalidate()
+
+    def _checkVersion(self):
+        mtime = self._versionMtime()
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        if readCatalogVersion(self.path) != self._version:
+            self.invalidate()
+
+    def refresh(self):
+        if hasattr(self.collection, "refresh"):
+            self.collection.refresh()
+        return self.warm()
+
+    def count(self):
+        return self.collection.count()
+
+    def query(self, query_texts, n_results=10, where=None, **kwargs):
+        if self.path:
+            self._checkVersion()
+        self._checkSource()
+        query_texts = list(query_texts)
+        table = self._table
+        found = [table.get(_key(text, n_results, where)) if not kwargs else None for text in query_texts]
+        metrics.PRECOMPUTED_LOOKUPS.inc(sum(f is not None for f in found), "hit")
+        metrics.PRECOMPUTED_LOOKUPS.inc(sum(f is None for f in found), "miss")
+        if all(f is not None for f in found):
+            fields = found[0].keys() if found else ("ids", "distances", "metadatas", "documents")
+            return {field: [f[field][0] for f in found] for field in fields}
+
+        missing = [i for i, f in enumerate(found) if f is None]
+        data = self.collection.query(query_texts=[query_texts[i] for i in missing],
+                                     n_results=n_results, where=where, **kwargs)
+        fields = [field for field in ("ids", "distances", "metadatas", "documents") if data.get(field) is not None]
+        result = {field: [] for field in fields}
+        fresh = dict(zip(missing, range(len(missing))))
+        for i, f in enumerate(found):
+            for field in fields:
+                result[field].append(data[field][fresh[i]] if f is None else f[field][0])
+        return result
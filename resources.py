@@ -0,0 +1,133 @@
+"""
+Process-wide resources shared by app.py, main.py and api.py, created lazily.
+
+Nothing is opened at import time, and chromadb is only imported when a
+collection is first needed. Each getter builds its resource once under a
+lock and returns the same object afterwards:
+
+- ``getEmbeddingFunction``: the caching OpenAI embedding function
+- ``getChromaClient(path)``: one ``PersistentClient`` per directory
+- ``getCatalog``: the catalog engine (``vector_index.catalogEngine``) over
+  the live version under CATALOG_VERSIONS_PATH once ``catalog_sync.py`` has
+  published one, else over CATALOG_PATH, or the shared memory-mapped export
+  when CATALOG_ENGINE=mmap
+- ``getDocs``: the docs collection used for RAG (DOCS_PATH)
+- ``getLLMClient``: the pooled synchronous OpenAI client
+
+``warmUp`` opens them ahead of the first request and can run one query.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_resources = {}
+# Re-entrant: getCatalog and getDocs call getChromaClient while holding it
+_lock = threading.RLock()
+
+
+def _lazy(key, factory):
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                resource = _resources[key] = factory()
+    return resource
+
+
+def getEmbeddingFunction():
+    from embeddings import makeEmbeddingFunction
+    return makeEmbeddingFunction()
+
+
+def getChromaClient(path):
+    def create():
+        import chromadb
+        return chromadb.PersistentClient(path=path)
+
+    return _lazy(("chroma", path), create)
+
+
+def _openCatalogVersion(path):
+    # Each version gets its own client, outside the registry, so a retired
+    # version can be closed instead of staying open for the process lifetime
+    import chromadb
+    from catalog_sync import closeClient
+    from vector_index import catalogEngine
+    client = chromadb.PersistentClient(path=path)
+    try:
+        collection = client.get_collection(name="catalogs", embedding_function=getEmbeddingFunction())
+        engine = catalogEngine(collection, path=path)
+    except BaseException:
+        closeClient(client)
+        raise
+    return engine, lambda: closeClient(client)
+
+
+def getCatalog():
+    def create():
+        from vector_index import catalogEngine
+        path = os.getenv("CATALOG_PATH", "catalog")
+        versions = os.getenv("CATALOG_VERSIONS_PATH", "catalog_versions")
+        if os.getenv("CATALOG_ENGINE", "chroma").lower() == "mmap":
+            from mapped_index import MappedCatalogIndex
+            # Workers share the exported index through the page cache and never open Chroma
+            collection = MappedCatalogIndex(
+                os.getenv("CATALOG_INDEX_PATH", "catalog_index"),
+                getEmbeddingFunction(),
+                rescore=int(os.getenv("CATALOG_RESCORE", "4"))
+            )
+        elif os.path.exists(os.path.join(versions, "CURRENT")):
+            from catalog_sync import LiveCatalog
+            # Follows the versions catalog_sync.py publishes, swapping engines without a restart
+            return LiveCatalog(versions, _openCatalogVersion)
+        else:
+            collection = getChromaClient(path).get_collection(
+                name="catalogs",
+                embedding_function=getEmbeddingFunction()
+            )
+        return catalogEngine(collection, path=path)
+
+    return _lazy("catalog", create)
+
+
+def catalogVersion():
+    """Name of the catalog version being served, or None for a single-store catalog."""
+    return getattr(getCatalog(), "version", None)
+
+
+def getDocs():
+    return _lazy("docs", lambda: getChromaClient(os.getenv("DOCS_PATH", "docs")).get_collection(
+        name="docs",
+        embedding_function=getEmbeddingFunction()
+    ))
+
+
+def getLLMClient():
+    import utils
+    return utils.getClient()
+
+
+def warmUp(query=None, catalog=True, docs=False):
+    """
+    Opens the requested resources and, with ``query``, runs one product search
+    so the embedding path and connection pools are hot. Returns seconds per step.
+    """
+    timings = {}
+    steps = [("llm_client", getLLMClient)]
+    if catalog:
+        steps.append(("catalog", getCatalog))
+    if docs:
+        steps.append(("docs", getDocs))
+    if query and catalog:
+        import utils
+        steps.append(("query", lambda: utils.getProducts(query, getCatalog())))
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - start
+    logger.info("Warm-up: %s", ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items()))
+    return timings
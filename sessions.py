@@ -0,0 +1,73 @@
+"""
+Server-side conversation state for the multi-turn recommendation flow.
+
+A session holds what the first turn produced (query, intent, follow-up
+questions, initial products and the wider candidate pool) so the final turn
+needs only the conversation id and the user's answers. Sessions live in a
+``cache.TTLCache``: an LRU bounded by SESSION_MAX in memory, expiring after
+SESSION_TTL seconds without an update, and persisted to SQLite when
+SESSION_PATH is set so they survive restarts.
+"""
+import os
+import threading
+import time
+import uuid
+
+from cache import TTLCache
+
+SESSION_NAMESPACE = "session"
+
+
+class SessionStore:
+    """Conversation id -> JSON-serializable state dict."""
+
+    def __init__(self, path=None, ttl=1800.0, max_sessions=10_000):
+        self.cache = TTLCache(path=path, ttl=ttl, max_memory=max_sessions, max_disk=max_sessions)
+        self._lock = threading.Lock()
+
+    def create(self, **state):
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        self.cache.set(conversation_id, dict(state, created_at=now, updated_at=now), namespace=SESSION_NAMESPACE)
+        return conversation_id
+
+    def get(self, conversation_id):
+        state = self.cache.get(conversation_id)
+        return dict(state) if state is not None else None
+
+    def update(self, conversation_id, **fields):
+        """Merges ``fields`` into the session and resets its TTL. Raises KeyError if it expired."""
+        with self._lock:
+            state = self.cache.get(conversation_id)
+            if state is None:
+                raise KeyError(conversation_id)
+            state = dict(state, **fields, updated_at=time.time())
+            self.cache.set(conversation_id, state, namespace=SESSION_NAMESPACE)
+        return state
+
+    def delete(self, conversation_id):
+        self.cache.delete(conversation_id)
+
+    def __len__(self):
+        return len(self.cache)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def getSessionStore():
+    """
+    Returns the process-wide session store, configured by SESSION_PATH
+    (SQLite file; memory only when unset), SESSION_TTL and SESSION_MAX.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore(
+                    path=os.getenv("SESSION_PATH") or None,
+                    ttl=float(os.getenv("SESSION_TTL", "1800")),
+                    max_sessions=int(os.getenv("SESSION_MAX", "10000"))
+                )
+    return _store
@@ -0,0 +1,154 @@
+"""
+Single-flight de-duplication of identical in-flight calls.
+
+When many requests ask for the same thing at once (a campaign email sends
+hundreds of users to the same query), only the first caller for a key makes
+the upstream call; everyone who arrives while it is running waits for and
+shares its result, or its exception. Nothing is kept once the call finishes;
+caching is the job of ``cache.TTLCache`` and the embedding cache.
+
+``SingleFlight`` is for threads, ``AsyncSingleFlight`` for coroutines on an
+event loop. Both count upstream and collapsed calls in ``metrics``.
+"""
+import asyncio
+import threading
+
+import metrics
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """Thread-safe single flight keyed by any hashable."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _record(self, upstream, collapsed):
+        if upstream:
+            metrics.COALESCED_CALLS.inc(upstream, self.name, "upstream")
+        if collapsed:
+            metrics.COALESCED_CALLS.inc(collapsed, self.name, "collapsed")
+
+    def do(self, key, fn):
+        """Returns ``fn()``, sharing one execution among concurrent callers with the same ``key``."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            self._record(0, 1)
+            return call.wait()
+        self._record(1, 0)
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def doMany(self, keys, fn):
+        """
+        Batch form for calls like embeddings: ``fn(leader_keys)`` is called
+        once with the keys nobody else is fetching and must return their
+        values in order. Returns ``{key: value}`` for all ``keys``.
+        """
+        leading, waiting = {}, {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                call = self._calls.get(key)
+                if call is None:
+                    leading[key] = self._calls[key] = _Call()
+                else:
+                    waiting[key] = call
+        self._record(1 if leading else 0, len(waiting))
+        values = {}
+        if leading:
+            try:
+                fetched = fn(list(leading))
+                for (key, call), value in zip(leading.items(), fetched):
+                    call.value = values[key] = value
+            except BaseException as e:
+                for call in leading.values():
+                    call.error = e
+                raise
+            finally:
+                with self._lock:
+                    for key in leading:
+                        del self._calls[key]
+                for call in leading.values():
+                    call.done.set()
+        for key, call in waiting.items():
+            values[key] = call.wait()
+        return values
+
+
+class _Flight:
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """
+    Single flight for coroutines. The shared call runs as its own task, so a
+    caller that is cancelled does not cancel it for the others; once every
+    waiter has been cancelled the task is cancelled too, which aborts the
+    upstream request.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, factory):
+        """Awaits ``factory()``, sharing one task among concurrent callers with the same ``key``."""
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        flight = self._calls.get(flight_key)
+        if flight is None:
+            flight = self._calls[flight_key] = _Flight(loop.create_task(factory()))
+            flight.task.add_done_callback(lambda done: self._finished(flight_key, done))
+            metrics.COALESCED_CALLS.inc(1, self.name, "upstream")
+        else:
+            metrics.COALESCED_CALLS.inc(1, self.name, "collapsed")
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Nobody is left to use the result; later callers start afresh
+                if self._calls.get(flight_key) is flight:
+                    del self._calls[flight_key]
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finished(self, flight_key, task):
+        flight = self._calls.get(flight_key)
+        if flight is not None and flight.task is task:
+            del self._calls[flight_key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,67 @@
+"""
+Token counting, chunking and truncation with a cached tokenizer.
+
+Uses tiktoken when it and its encoding file are available; otherwise falls
+back to whitespace-delimited word pieces, which over-count slightly but keep
+chunk sizes in the right range without any network access.
+"""
+import os
+import re
+from functools import lru_cache
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+
+_WORD_PIECE = re.compile(r"\S+\s*|\s+")
+
+
+class WordPieceEncoding:
+    """Fallback encoding: each word with its trailing whitespace is one token."""
+
+    name = "word-pieces"
+
+    def encode(self, text):
+        return _WORD_PIECE.findall(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=None)
+def getEncoding(name=TOKENIZER_ENCODING):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception:
+        return WordPieceEncoding()
+
+
+@lru_cache(maxsize=8192)
+def countTokens(text):
+    return len(getEncoding().encode(text))
+
+
+def chunkText(text, max_tokens=400, overlap=50):
+    """
+    Splits ``text`` into windows of at most ``max_tokens`` tokens, each
+    repeating the last ``overlap`` tokens of the previous one.
+    """
+    encoding = getEncoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return [text]
+    step = max(1, max_tokens - overlap)
+    chunks = []
+    for start in range(0, len(tokens), step):
+        chunks.append(encoding.decode(tokens[start:start + max_tokens]).strip())
+        if start + max_tokens >= len(tokens):
+            break
+    return chunks
+
+
+def truncateText(text, max_tokens):
+    """Cuts ``text`` to its first ``max_tokens`` tokens."""
+    encoding = getEncoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]).rstrip() + " …"
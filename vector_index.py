@@ -0,0 +1,259 @@
+"""
+In-process NumPy index for the product catalog.
+
+``CatalogIndex`` loads every embedding and metadata row of the ``catalogs``
+collection into one contiguous float32 matrix and parallel arrays, and answers
+top-k with a single matrix-vector product plus ``argpartition``. It mimics
+the subset of ``Collection.query`` that ``utils.getProducts`` uses, so it can be
+passed anywhere a catalog collection is expected.
+
+The matrix can be shortened to the first ``dimensions`` columns (how
+text-embedding-3 vectors are shortened, so stored full-size vectors match
+queries embedded with EMBEDDING_DIMENSIONS) and stored as float16 or int8.
+A quantized index ranks ``rescore`` times as many rows as asked for and
+re-ranks them with full-precision vectors fetched from the collection.
+"""
+import os
+import threading
+
+import numpy as np
+
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+# Rows widened to float32 per block when scoring a quantized matrix
+_SCAN_ROWS = 128
+
+
+def normalizeRows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def truncateRows(matrix, dimensions=None):
+    """Keeps the first ``dimensions`` columns and re-normalizes the rows."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dimensions and matrix.ndim == 2 and matrix.shape[1] > dimensions:
+        matrix = matrix[:, :dimensions]
+    return normalizeRows(matrix)
+
+
+def quantizeRows(matrix, quantization="float32"):
+    """
+    Returns ``(codes, scales)``. int8 codes are scaled per row by its largest
+    absolute value, so a row's score is ``(codes @ q) * scale``.
+    """
+    if quantization == "float32":
+        return np.ascontiguousarray(matrix, dtype=np.float32), None
+    if quantization == "float16":
+        return np.ascontiguousarray(matrix, dtype=np.float16), None
+    if quantization == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.ones(0)
+        scales[scales == 0] = 1.0
+        codes = np.round(matrix / scales[:, None]).astype(np.int8)
+        return np.ascontiguousarray(codes), scales.astype(np.float32)
+    raise ValueError(f"unknown quantization {quantization!r}; expected one of {QUANTIZATIONS}")
+
+
+_COMPARATORS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matchesWhere(metadata, where):
+    """Evaluates the subset of Chroma's ``where`` syntax used by ``utils.productFilter``."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matchesWhere(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matchesWhere(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            if not all(_COMPARATORS[op](value, operand) for op, operand in condition.items()):
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class IndexSnapshot:
+    """
+    Immutable view of the index; queries hold one so a refresh never tears a read.
+
+    ``fetch(rows)`` returns full-precision vectors for row indices and enables
+    rescoring of a quantized matrix. With ``prepared`` the matrix (and int8
+    ``scales``) are already normalized and quantized, e.g. read-only memory
+    maps, and are used without a copy.
+    """
+
+    def __init__(self, ids, matrix, metadatas, documents, dimensions=None, quantization="float32",
+                 rescore=4, fetch=None, prepared=False, scales=None):
+        self.ids = np.asarray(ids, dtype=object)
+        if prepared:
+            self.matrix, self.scales = matrix, scales
+        else:
+            self.matrix, self.scales = quantizeRows(truncateRows(matrix, dimensions), quantization)
+        self.dimensions = self.matrix.shape[1] if self.matrix.ndim == 2 else dimensions
+        self.quantization = self.matrix.dtype.name
+        self.rescore = rescore if fetch is not None and self.quantization != "float32" else 0
+        self.fetch = fetch
+        self.metadatas = metadatas
+        self.documents = documents
+        self.names = np.asarray([m.get("Name") for m in metadatas], dtype=object)
+        self.prices = np.asarray([m.get("price", np.nan) for m in metadatas], dtype=np.float64)
+        self.margins = np.asarray([m.get("margin", 0.0) for m in metadatas], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        """Memory held by the (possibly quantized) matrix."""
+        return self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, q):
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ q
+        # NumPy has no fast float16/int8 products; widen cache-sized blocks instead
+        scores = np.empty(len(self.matrix), dtype=np.float32)
+        block = np.empty((_SCAN_ROWS, self.matrix.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.matrix), _SCAN_ROWS):
+            rows = self.matrix[start:start + _SCAN_ROWS]
+            part = block[:len(rows)]
+            np.copyto(part, rows, casting="unsafe")
+            scores[start:start + len(rows)] = part @ q
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def mask(self, where):
+        """Boolean row mask for a Chroma-style ``where`` clause."""
+        return np.fromiter((matchesWhere(m, where) for m in self.metadatas), dtype=bool, count=len(self.metadatas))
+
+    def topk(self, query_vector, k, mask=None):
+        """Returns (row indices, cosine similarities) of the ``k`` best rows, best first."""
+        q = truncateRows(np.asarray(query_vector, dtype=np.float32)[None, :], self.dimensions)[0]
+        scores = self.scores(q)
+        available = len(scores)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            available = int(mask.sum())
+        k = min(k, available)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        pool = min(available, k * self.rescore) if self.rescore else k
+        if pool < len(scores):
+            idx = np.argpartition(-scores, pool - 1)[:pool]
+        else:
+            idx = np.arange(len(scores))
+        if self.rescore:
+            exact = truncateRows(self.fetch(idx), self.dimensions) @ q
+            order = np.argsort(-exact)[:k]
+            return idx[order], exact[order]
+        idx = idx[np.argsort(-scores[idx])][:k]
+        return idx, scores[idx]
+
+
+class CatalogIndex:
+    """
+    NumPy-backed stand-in for the catalog collection.
+
+    Call ``refresh()`` after catalog ingestion to reload from the collection.
+    ``dimensions``, ``quantization`` and ``rescore`` are passed to each
+    ``IndexSnapshot``; rescoring reads full-precision vectors back from the
+    collection.
+    """
+
+    def __init__(self, collection, embedding_function=None, dimensions=None, quantization="float32", rescore=4):
+        self.collection = collection
+        self.embedding_function = embedding_function or getattr(collection, "_embedding_function", None)
+        self.dimensions = dimensions
+        self.quantization = quantization
+        self.rescore = rescore
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.refresh()
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def refresh(self):
+        """Reloads embeddings and metadata from the backing collection and swaps them in."""
+        data = self.collection.get(include=["embeddings", "metadatas", "documents"])
+        ids = list(data["ids"])
+        snapshot = IndexSnapshot(ids, data["embeddings"], data["metadatas"], data["documents"],
+                                 dimensions=self.dimensions, quantization=self.quantization,
+                                 rescore=self.rescore, fetch=lambda rows: self._vectors([ids[i] for i in rows]))
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def _vectors(self, ids):
+        data = self.collection.get(ids=ids, include=["embeddings"])
+        by_id = dict(zip(data["ids"], data["embeddings"]))
+        return np.asarray([by_id[i] for i in ids], dtype=np.float32)
+
+    def count(self):
+        return len(self._snapshot)
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None, **kwargs):
+        """
+        Chroma-shaped top-k. Distances are squared l2 distances between unit
+        vectors (2 - 2 * cosine), matching the catalog collection's l2 space.
+        """
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts))
+        snapshot = self._snapshot
+        mask = snapshot.mask(where) if where else None
+        result = {"ids": [], "distances": [], "metadatas": [], "documents": []}
+        for vector in query_embeddings:
+            idx, scores = snapshot.topk(vector, n_results, mask)
+            result["ids"].append([snapshot.ids[i] for i in idx])
+            result["distances"].append([float(2.0 - 2.0 * s) for s in scores])
+            result["metadatas"].append([snapshot.metadatas[i] for i in idx])
+            result["documents"].append([snapshot.documents[i] for i in idx])
+        return result
+
+
+def baseCollection(engine):
+    """Unwraps catalog engine wrappers down to the Chroma collection they read from."""
+    while hasattr(engine, "collection"):
+        engine = engine.collection
+    return engine
+
+
+def catalogEngine(collection, path=None):
+    """
+    Wraps the catalog collection in a ``CatalogIndex`` when CATALOG_ENGINE=numpy
+    (stored as CATALOG_QUANTIZATION, rescoring CATALOG_RESCORE times k rows),
+    then in a ``bm25.HybridCatalog`` when CATALOG_HYBRID=1, and finally in a
+    warmed ``precomputed.PrecomputedCatalog`` unless PRECOMPUTED_ENABLED=0.
+    ``path`` is the Chroma directory, watched for catalog version changes.
+    A ``mapped_index.MappedCatalogIndex`` (CATALOG_ENGINE=mmap) is passed in
+    by the caller in place of the collection.
+    """
+    engine = collection
+    if os.getenv("CATALOG_ENGINE", "chroma").lower() == "numpy":
+        engine = CatalogIndex(
+            collection,
+            dimensions=int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None,
+            quantization=os.getenv("CATALOG_QUANTIZATION", "float32").lower(),
+            rescore=int(os.getenv("CATALOG_RESCORE", "4"))
+        )
+    if os.getenv("CATALOG_HYBRID", "0") == "1":
+        from bm25 import HybridCatalog
+        engine = HybridCatalog(engine)
+    if os.getenv("PRECOMPUTED_ENABLED", "1") != "0":
+        from precomputed import PrecomputedCatalog
+        engine = PrecomputedCatalog(engine, path=path)
+    return engine